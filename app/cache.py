@@ -0,0 +1,363 @@
+import logging
+import os
+import pickle
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Ограниченный по размеру LRU-кэш с временем жизни записей"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> bool:
+        """Записывает значение, только если ключа нет или он истек"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return False
+            self._data[key] = (expires_at, value)
+            return True
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+class SharedStore:
+    """
+    Файл SQLite, общий для всех воркеров на одной машине (по умолчанию
+    в /dev/shm, то есть в памяти). Соединение открывается лениво в каждом
+    процессе: при preload в gunicorn мастер не должен передавать его воркерам.
+
+    Файл лежит в закрытом каталоге (0700) и создается с правами 0600:
+    значения распаковываются pickle, так что писать в хранилище должен
+    только пользователь приложения.
+
+    Вызовы синхронные и выполняются в event loop: чтение - десятки
+    микросекунд, запись дайджеста на 100 КБ - меньше миллисекунды.
+    Дольше всего SQLite ждет блокировку при одновременной записи из
+    нескольких процессов. Это ожидание ограничено SHARED_CACHE_BUSY_TIMEOUT,
+    после чего операция пропускается, как промах кэша.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 0.1):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._pid: Optional[int] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    def prepare(self) -> None:
+        """Создает закрытый каталог и файл; ошибка, если каталог доступен другим"""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.lstat(directory)
+        if (
+            not stat.S_ISDIR(info.st_mode)
+            or info.st_uid != os.getuid()
+            or info.st_mode & 0o077
+        ):
+            raise RuntimeError(
+                f"Shared cache directory {directory} must be owned by the "
+                "application user and not accessible to others (mode 0700)"
+            )
+        # Файлы -wal и -shm SQLite создает с правами основного файла
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            os.fchmod(fd, 0o600)
+        finally:
+            os.close(fd)
+
+    def connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self.prepare()
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            # Это кэш: переживать сбой питания данным не нужно
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    cache TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    stamp TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    value BLOB NOT NULL,
+                    PRIMARY KEY (cache, key)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS cache_entries_expiry
+                    ON cache_entries (cache, expires_at);
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                ) WITHOUT ROWID;
+                """
+            )
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def reset(self) -> None:
+        """Удаляет файл; вызывается мастером gunicorn до запуска воркеров"""
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(self.path + suffix)
+            except FileNotFoundError:
+                pass
+
+
+class SharedTTLCache:
+    """
+    TTLCache поверх SharedStore: значение, положенное одним воркером,
+    видно остальным. Значения сериализуются pickle.
+
+    Каждая запись помечается случайной меткой. Процесс держит у себя
+    последние распакованные объекты и, если метка в хранилище не
+    изменилась, возвращает свой объект без распаковки - так сохраняются
+    вычисленные по месту поля (например, сжатые варианты дайджеста).
+    При переполнении вытесняются записи с самым ранним сроком истечения.
+    """
+
+    # Как часто (в записях) проверять переполнение и чистить истекшие записи
+    TRIM_EVERY = 100
+
+    def __init__(self, name: str, maxsize: int, ttl: float, store: "SharedStore"):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.store = store
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._writes = 0
+        _registry[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        skey = repr(key)
+        try:
+            with self.store.lock:
+                connection = self.store.connection()
+                row = connection.execute(
+                    "SELECT stamp FROM cache_entries "
+                    "WHERE cache = ? AND key = ? AND expires_at > ?",
+                    (self.name, skey, time.time()),
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return default
+                local = self._local.get(skey)
+                if local is not None and local[0] == row[0]:
+                    self._local.move_to_end(skey)
+                    self.hits += 1
+                    return local[1]
+                row = connection.execute(
+                    "SELECT stamp, value FROM cache_entries "
+                    "WHERE cache = ? AND key = ?",
+                    (self.name, skey),
+                ).fetchone()
+        except sqlite3.OperationalError as e:
+            self._busy("get", e)
+            row = None
+        if row is None:
+            self.misses += 1
+            return default
+        try:
+            value = pickle.loads(row[1])
+        except Exception as e:
+            # Запись от несовместимой версии кода
+            logger.warning(f"Dropping unreadable {self.name} cache entry: {str(e)}")
+            self.invalidate(key)
+            self.misses += 1
+            return default
+        self._remember_local(skey, row[0], value)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._write(key, value, ttl, only_if_absent=False)
+
+    def add(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> bool:
+        """Атомарно для всех воркеров: записывает, только если ключа нет или он истек"""
+        return self._write(key, value, ttl, only_if_absent=True)
+
+    def _write(
+        self, key: Hashable, value: Any, ttl: Optional[float], only_if_absent: bool
+    ) -> bool:
+        skey, stamp, now = repr(key), uuid.uuid4().hex, time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        condition = "WHERE cache_entries.expires_at <= ?" if only_if_absent else ""
+        params = (self.name, skey, stamp, expires_at, data)
+        try:
+            with self.store.lock:
+                connection = self.store.connection()
+                cursor = connection.execute(
+                    "INSERT INTO cache_entries (cache, key, stamp, expires_at, value) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (cache, key) DO UPDATE SET stamp = excluded.stamp, "
+                    "expires_at = excluded.expires_at, "
+                    f"value = excluded.value {condition}",
+                    params + ((now,) if only_if_absent else ()),
+                )
+                written = cursor.rowcount > 0
+                if written:
+                    self._remember_local(skey, stamp, value)
+                    self._writes += 1
+                    if self._writes % self.TRIM_EVERY == 0:
+                        self._trim(connection, now)
+        except sqlite3.OperationalError as e:
+            # Незаписанное значение - обычный промах для следующего чтения,
+            # а не взятая аренда достанется следующей попытке
+            self._busy("set", e)
+            return False
+        return written
+
+    def _busy(self, operation: str, error: sqlite3.OperationalError) -> None:
+        logger.warning(f"Shared {self.name} cache {operation} skipped: {str(error)}")
+
+    def _trim(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute(
+            "DELETE FROM cache_entries WHERE cache = ? AND expires_at <= ?",
+            (self.name, now),
+        )
+        (size,) = connection.execute(
+            "SELECT count(*) FROM cache_entries WHERE cache = ?", (self.name,)
+        ).fetchone()
+        if size > self.maxsize:
+            connection.execute(
+                "DELETE FROM cache_entries WHERE cache = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE cache = ? "
+                "ORDER BY expires_at LIMIT ?)",
+                (self.name, self.name, size - self.maxsize),
+            )
+
+    def _remember_local(self, skey: str, stamp: str, value: Any) -> None:
+        self._local[skey] = (stamp, value)
+        self._local.move_to_end(skey)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        skey = repr(key)
+        with self.store.lock:
+            self._local.pop(skey, None)
+            try:
+                self.store.connection().execute(
+                    "DELETE FROM cache_entries WHERE cache = ? AND key = ?",
+                    (self.name, skey),
+                )
+            except sqlite3.OperationalError as e:
+                self._busy("invalidate", e)
+
+    def clear(self) -> None:
+        with self.store.lock:
+            self.store.connection().execute(
+                "DELETE FROM cache_entries WHERE cache = ?", (self.name,)
+            )
+            self._local.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self.store.lock:
+            (size,) = (
+                self.store.connection()
+                .execute(
+                    "SELECT count(*) FROM cache_entries WHERE cache = ?", (self.name,)
+                )
+                .fetchone()
+            )
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": size,
+            "maxsize": self.maxsize,
+        }
+
+
+_registry: Dict[str, Any] = {}
+_shared_store: Optional[SharedStore] = None
+
+
+def get_shared_store() -> SharedStore:
+    global _shared_store
+    if _shared_store is None:
+        settings = get_settings()
+        path = settings.shared_cache_path
+        if not path:
+            # Каталог на пользователя: в общем /dev/shm имя файла предсказуемо
+            base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(base, f"enecawork-{os.getuid()}", "cache.sqlite3")
+        _shared_store = SharedStore(path, settings.shared_cache_busy_timeout)
+    return _shared_store
+
+
+def create_cache(name: str, maxsize: int, ttl: float, shared: bool = True):
+    """
+    Кэш в памяти процесса или общий для воркеров (CACHE_BACKEND=shared).
+    Интерфейс одинаковый: get/set/add/invalidate/clear/stats.
+    shared=False - всегда в памяти процесса (для секретов, которые
+    не должны попадать в файл).
+    """
+    if shared and get_settings().cache_backend == "shared":
+        return SharedTTLCache(name, maxsize, ttl, get_shared_store())
+    return TTLCache(name, maxsize, ttl)
+
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Счетчики попаданий/промахов всех кэшей процесса"""
+    return {name: cache.stats() for name, cache in _registry.items()}
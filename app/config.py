@@ -1,4 +1,5 @@
 import os
+from datetime import time
 from dotenv import load_dotenv
 from functools import lru_cache
 
@@ -10,6 +11,155 @@ class Settings:
     supabase_key = os.getenv("SUPABASE_KEY")
     supabase_service_key = os.getenv("SUPABASE_SERVICE_KEY")
 
+    # Пул HTTP-соединений к Supabase (общий для PostgREST и GoTrue)
+    http_max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+    http_max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+    http_timeout = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+    # Проверка access-токенов: "local" (подпись и срок локально) или "remote"
+    jwt_verification = os.getenv("JWT_VERIFICATION", "local")
+    supabase_jwt_secret = os.getenv("SUPABASE_JWT_SECRET")
+    jwks_refresh_interval = int(os.getenv("JWKS_REFRESH_INTERVAL", "600"))
+
+    # Сколько секунд повторный refresh того же токена получает уже выданную пару
+    refresh_result_ttl = float(os.getenv("REFRESH_RESULT_TTL", "10"))
+
+    # Ограничение частоты запросов к auth до обращения в Supabase.
+    # Формат "<число>/<second|minute|hour|day>", пустая строка - без лимита
+    rate_limit_enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    # За роутером Heroku (задана DYNO) адрес соединения - адрес роутера, поэтому
+    # клиент берется из X-Forwarded-For. Без прокси заголовку верить нельзя
+    rate_limit_trust_proxy = os.getenv(
+        "RATE_LIMIT_TRUST_PROXY", "true" if os.getenv("DYNO") else "false"
+    ).lower() == "true"
+    rate_limit_login_ip = os.getenv("RATE_LIMIT_LOGIN_IP", "30/minute")
+    rate_limit_login_email = os.getenv("RATE_LIMIT_LOGIN_EMAIL", "5/minute")
+    rate_limit_register_ip = os.getenv("RATE_LIMIT_REGISTER_IP", "10/hour")
+    rate_limit_register_email = os.getenv("RATE_LIMIT_REGISTER_EMAIL", "3/hour")
+    rate_limit_reset_password_ip = os.getenv("RATE_LIMIT_RESET_PASSWORD_IP", "10/hour")
+    rate_limit_reset_password_email = os.getenv(
+        "RATE_LIMIT_RESET_PASSWORD_EMAIL", "3/hour"
+    )
+
+    # Хранилище кэшей: "memory" (в процессе) или "shared" (общее для воркеров
+    # на машине, файл SQLite; по умолчанию в /dev/shm/enecawork-<uid>/).
+    # Каталог файла должен принадлежать пользователю приложения с правами 0700
+    cache_backend = os.getenv("CACHE_BACKEND", "memory")
+    shared_cache_path = os.getenv("SHARED_CACHE_PATH", "")
+    # Сколько секунд event loop ждет блокировку общего файла, затем операция
+    # пропускается (промах кэша, запрос без проверки лимита)
+    shared_cache_busy_timeout = float(os.getenv("SHARED_CACHE_BUSY_TIMEOUT", "0.1"))
+
+    # Кэш профилей пользователей
+    user_cache_size = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    user_cache_ttl = float(os.getenv("USER_CACHE_TTL", "60"))
+
+    # Кэш текстов дайджестов: прошлые даты почти не меняются, сегодняшние - могут
+    digest_cache_size = int(os.getenv("DIGEST_CACHE_SIZE", "5000"))
+    digest_cache_ttl_past = float(os.getenv("DIGEST_CACHE_TTL_PAST", "86400"))
+    digest_cache_ttl_today = float(os.getenv("DIGEST_CACHE_TTL_TODAY", "60"))
+    digest_cache_ttl_missing = float(os.getenv("DIGEST_CACHE_TTL_MISSING", "30"))
+    digest_html_cache_size = int(os.getenv("DIGEST_HTML_CACHE_SIZE", "2000"))
+
+    # Stale-while-revalidate: сколько секунд после срока свежести дайджесты
+    # и список проектов еще отдаются, пока их перечитывают в фоне (0 - выключено)
+    stale_max_age = float(os.getenv("STALE_MAX_AGE", "3600"))
+
+    # Индекс проектов: фоновое обновление и предельный возраст данных
+    project_index_refresh_interval = float(
+        os.getenv("PROJECT_INDEX_REFRESH_INTERVAL", "300")
+    )
+    project_index_max_age = float(os.getenv("PROJECT_INDEX_MAX_AGE", "900"))
+
+    # Ограничения пакетного запроса дайджестов
+    digest_batch_max_projects = int(os.getenv("DIGEST_BATCH_MAX_PROJECTS", "200"))
+    digest_batch_max_days = int(os.getenv("DIGEST_BATCH_MAX_DAYS", "31"))
+    digest_batch_max_cells = int(os.getenv("DIGEST_BATCH_MAX_CELLS", "1000"))
+
+    # Максимальный период календаря наличия дайджестов (дней)
+    digest_calendar_max_days = int(os.getenv("DIGEST_CALENDAR_MAX_DAYS", "731"))
+
+    # Полнотекстовый поиск по дайджестам: индекс в памяти каждого воркера,
+    # при превышении SEARCH_MAX_DOCUMENTS вытесняются самые старые дайджесты
+    search_enabled = os.getenv("SEARCH_ENABLED", "true").lower() == "true"
+    search_index_refresh_interval = float(
+        os.getenv("SEARCH_INDEX_REFRESH_INTERVAL", "300")
+    )
+    search_max_documents = int(os.getenv("SEARCH_MAX_DOCUMENTS", "50000"))
+
+    # Ответы меньше этого размера (байт) не сжимаются
+    compression_min_size = int(os.getenv("COMPRESSION_MIN_SIZE", "500"))
+
+    # Размер страницы при потоковой выгрузке истории дайджестов
+    digest_export_page_size = int(os.getenv("DIGEST_EXPORT_PAGE_SIZE", "200"))
+
+    # Устойчивость вызовов Supabase: таймаут по умолчанию и по операциям
+    # ("digest_reports.scan=20,auth.jwks=5"), повторы идемпотентных чтений
+    # с экспоненциальной задержкой и предохранитель на каждый upstream
+    upstream_timeout = float(os.getenv("UPSTREAM_TIMEOUT", "8"))
+    upstream_timeouts = os.getenv("UPSTREAM_TIMEOUTS", "digest_reports.scan=20")
+    upstream_retries = int(os.getenv("UPSTREAM_RETRIES", "2"))
+    upstream_retry_backoff = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.1"))
+    circuit_failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    circuit_reset_timeout = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+    # Фоновые пробы PostgREST/GoTrue для /health/deep: интервал и таймаут (секунды),
+    # размер окна замеров и порог p95-латентности, выше которого upstream "degraded"
+    health_probe_interval = float(os.getenv("HEALTH_PROBE_INTERVAL", "15"))
+    health_probe_timeout = float(os.getenv("HEALTH_PROBE_TIMEOUT", "3"))
+    health_probe_window = int(os.getenv("HEALTH_PROBE_WINDOW", "40"))
+    health_latency_threshold = float(os.getenv("HEALTH_LATENCY_THRESHOLD", "1.0"))
+
+    # Ежедневный прогрев кэша вчерашними дайджестами (локальное время "HH:MM",
+    # после генерации дайджестов; пустая строка - выключен). Пока дайджестов
+    # за день нет, попытка повторяется через retry_interval секунд
+    digest_prewarm_time = os.getenv("DIGEST_PREWARM_TIME", "00:30")
+    digest_prewarm_retry_interval = float(
+        os.getenv("DIGEST_PREWARM_RETRY_INTERVAL", "600")
+    )
+    digest_prewarm_attempts = int(os.getenv("DIGEST_PREWARM_ATTEMPTS", "6"))
+
+    # Сколько секунд старт ждет прогрева пула соединений и индекса проектов
+    startup_warmup_timeout = float(os.getenv("STARTUP_WARMUP_TIMEOUT", "10"))
+
+    def validate(self) -> None:
+        """
+        Проверка конфигурации при старте, чтобы ошибка не всплыла
+        на первом запросе
+        """
+        problems = [
+            f"{name.upper()} is not set"
+            for name in ("supabase_url", "supabase_key", "supabase_service_key")
+            if not getattr(self, name)
+        ]
+        if self.supabase_url and not self.supabase_url.startswith(
+            ("http://", "https://")
+        ):
+            problems.append("SUPABASE_URL must start with http:// or https://")
+        if self.jwt_verification not in ("local", "remote"):
+            problems.append("JWT_VERIFICATION must be 'local' or 'remote'")
+        if self.cache_backend not in ("memory", "shared"):
+            problems.append("CACHE_BACKEND must be 'memory' or 'shared'")
+        if self.digest_prewarm_time:
+            try:
+                time.fromisoformat(self.digest_prewarm_time)
+            except ValueError:
+                problems.append("DIGEST_PREWARM_TIME must be in HH:MM format")
+        for name in (
+            "http_max_connections",
+            "http_timeout",
+            "user_cache_size",
+            "digest_cache_size",
+            "project_index_refresh_interval",
+            "project_index_max_age",
+            "search_index_refresh_interval",
+            "search_max_documents",
+        ):
+            if getattr(self, name) <= 0:
+                problems.append(f"{name.upper()} must be positive")
+        if problems:
+            raise ValueError("Invalid configuration: " + "; ".join(problems))
+
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -1,16 +1,165 @@
 from functools import lru_cache
+from typing import Dict, Optional
+import httpx
+from gotrue import AsyncGoTrueClient
+from postgrest import AsyncPostgrestClient
 from app.config import get_settings
-from supabase import create_client, Client
 
 
-settings = get_settings()
+# Настройки читаются при создании клиентов, а не при импорте модуля:
+# проверка конфигурации происходит в lifespan приложения
+
+
+# Подмена транспорта для бенчмарков и локальных стендов без Supabase
+_transport_override: Optional[httpx.AsyncBaseTransport] = None
+
+
+def override_http_transport(transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    """Все асинхронные клиенты, созданные после вызова, пойдут через transport"""
+    global _transport_override
+    _transport_override = transport
+    get_http_transport.cache_clear()
+    get_http_client.cache_clear()
+    get_async_supabase.cache_clear()
+    get_async_admin_client.cache_clear()
+
+
+@lru_cache()
+def get_http_transport() -> httpx.AsyncBaseTransport:
+    """Общий пул соединений, на котором работают все асинхронные клиенты"""
+    if _transport_override is not None:
+        return _transport_override
+    settings = get_settings()
+    return httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive,
+        ),
+    )
+
+
+@lru_cache()
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Клиент для произвольных запросов к Supabase на общем пуле.
+    Не закрывать вручную: закрытие клиента закрывает и общий транспорт.
+    """
+    return httpx.AsyncClient(
+        timeout=get_settings().http_timeout,
+        follow_redirects=True,
+        transport=get_http_transport(),
+    )
+
+
+def _key_headers(key: str) -> Dict[str, str]:
+    return {"apiKey": key, "Authorization": f"Bearer {key}"}
+
+
+class PooledPostgrestClient(AsyncPostgrestClient):
+    """PostgREST-клиент, использующий общий пул соединений"""
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            follow_redirects=True,
+            transport=get_http_transport(),
+        )
+
+
+class AsyncSupabase:
+    """Асинхронный аналог supabase.Client: PostgREST и GoTrue на общем пуле"""
+
+    def __init__(self, key: str):
+        settings = get_settings()
+        self._key = key
+        self.postgrest = PooledPostgrestClient(
+            f"{settings.supabase_url}/rest/v1",
+            headers={
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+                **_key_headers(key),
+            },
+            timeout=settings.http_timeout,
+        )
+        self.auth = self._create_auth()
+
+    def _create_auth(self) -> AsyncGoTrueClient:
+        return AsyncGoTrueClient(
+            url=f"{get_settings().supabase_url}/auth/v1",
+            headers=_key_headers(self._key),
+            auto_refresh_token=False,
+            persist_session=False,
+            http_client=get_http_client(),
+        )
+
+    def session_scoped(self) -> "AsyncSupabase":
+        """
+        Копия с собственным GoTrue-клиентом для операций в сессии пользователя.
+        PostgREST-клиент и пул соединений общие, создание копии не делает
+        сетевых запросов.
+        """
+        scoped = object.__new__(AsyncSupabase)
+        scoped._key = self._key
+        scoped.postgrest = self.postgrest
+        scoped.auth = self._create_auth()
+        return scoped
+
+    def from_(self, table: str):
+        return self.postgrest.from_(table)
+
+    def table(self, table: str):
+        return self.postgrest.from_(table)
 
 
 @lru_cache()
-def get_supabase() -> Client:
-    return create_client(settings.supabase_url, settings.supabase_key)
+def get_async_supabase() -> AsyncSupabase:
+    return AsyncSupabase(get_settings().supabase_key)
 
 
 @lru_cache()
-def get_admin_client() -> Client:
-    return create_client(settings.supabase_url, settings.supabase_service_key)
+def get_async_admin_client() -> AsyncSupabase:
+    return AsyncSupabase(get_settings().supabase_service_key)
+
+
+def get_async_session_client() -> AsyncSupabase:
+    """
+    Зависимость для эндпоинтов, которые создают или используют сессию
+    пользователя: состояние GoTrue не разделяется между запросами.
+    """
+    return get_async_supabase().session_scoped()
+
+
+def get_async_admin_session_client() -> AsyncSupabase:
+    """
+    То же с сервисным ключом: sign_up сохраняет сессию в GoTrue-клиенте,
+    поэтому общий get_async_admin_client для этого не подходит.
+    """
+    return get_async_admin_client().session_scoped()
+
+
+async def warm_up_http_pool() -> None:
+    """
+    Создаем клиенты и открываем соединение с Supabase до первого запроса,
+    чтобы первый пользователь после деплоя не ждал TCP/TLS-рукопожатия.
+    """
+    settings = get_settings()
+    get_async_supabase()
+    get_async_admin_client()
+    # Любой ответ PostgREST подходит: важно лишь, что соединение осталось в пуле
+    await get_http_client().get(
+        f"{settings.supabase_url}/rest/v1/",
+        headers=_key_headers(settings.supabase_key),
+    )
+
+
+async def close_http_pool() -> None:
+    """Закрываем общий пул соединений при остановке приложения"""
+    if get_http_transport.cache_info().currsize:
+        await get_http_transport().aclose()
+        get_http_transport.cache_clear()
+    get_http_client.cache_clear()
+    get_async_supabase.cache_clear()
+    get_async_admin_client.cache_clear()
@@ -0,0 +1,8 @@
+class UpstreamUnavailableError(Exception):
+    """Supabase недоступен: открыт предохранитель, истек таймаут или оборвалась связь"""
+
+    def __init__(self, operation: str, details: str, retry_after: float = 0):
+        self.operation = operation
+        self.retry_after = retry_after
+        self.message = f"Сервис данных недоступен при {operation}: {details}"
+        super().__init__(self.message)
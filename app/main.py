@@ -1,16 +1,43 @@
-from fastapi import FastAPI, Request, status
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from app.routes import auth_router, user_router, digest_router
-from app.exceptions.digest import (
+import time
+
+# Время импорта приложения (зависимости, роутеры, клиенты) попадает в метрики
+_import_started = time.perf_counter()
+
+import asyncio  # noqa: E402
+import math  # noqa: E402
+from contextlib import asynccontextmanager, suppress  # noqa: E402
+from fastapi import FastAPI, Request, status  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from fastapi.responses import JSONResponse, PlainTextResponse  # noqa: E402
+from app.routes import (  # noqa: E402
+    auth_router,
+    user_router,
+    digest_router,
+    health_router,
+)
+from app.middleware import CompressionMiddleware, MetricsMiddleware  # noqa: E402
+from app.metrics import APP_STARTUP, render_metrics  # noqa: E402
+from app.config import get_settings  # noqa: E402
+from app.database import (  # noqa: E402
+    close_http_pool,
+    get_async_supabase,
+    warm_up_http_pool,
+)
+from app.services.digest_index import project_index  # noqa: E402
+from app.services.digest_prewarm import digest_prewarmer  # noqa: E402
+from app.services.health import health_monitor  # noqa: E402
+from app.services.search import search_index  # noqa: E402
+from app.services.token import get_token_verifier  # noqa: E402
+from app.exceptions.digest import (  # noqa: E402
     DigestBaseException,
     DigestNotFoundException,
     DigestAuthError,
     DigestDatabaseError,
     DigestValidationError,
 )
-import logging
-import sys
+from app.exceptions.upstream import UpstreamUnavailableError  # noqa: E402
+import logging  # noqa: E402
+import sys  # noqa: E402
 
 
 # Setup logging with console output
@@ -25,7 +52,54 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.info("Application starting...")
 
-app = FastAPI(title="Backend for eneca.work")
+
+async def warm_up() -> None:
+    """Соединение с Supabase, ключи JWKS и список проектов до первого запроса"""
+    await warm_up_http_pool()
+    await asyncio.gather(
+        get_token_verifier().warm_up(),
+        project_index.refresh(get_async_supabase()),
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    app.state.ready = False
+    settings = get_settings()
+    settings.validate()
+    try:
+        await asyncio.wait_for(warm_up(), timeout=settings.startup_warmup_timeout)
+    except Exception as e:
+        # Supabase недоступен - стартуем, но /health/ready ответит 503,
+        # пока фоновое обновление не загрузит индекс
+        logger.warning(f"Startup warm-up incomplete: {e!r}")
+
+    # Фоновое обновление индекса проектов
+    index_task = asyncio.create_task(project_index.run(get_async_supabase()))
+    # Пробы upstream для /health/deep
+    health_task = asyncio.create_task(health_monitor.run())
+    # Ежедневный прогрев кэша дайджестами за вчера
+    prewarm_task = asyncio.create_task(digest_prewarmer.run(get_async_supabase()))
+    tasks = [index_task, health_task, prewarm_task]
+    if settings.search_enabled:
+        # Индекс полнотекстового поиска строится в фоне, не задерживая старт
+        tasks.append(asyncio.create_task(search_index.run(get_async_supabase())))
+    app.state.ready = True
+    startup_time = time.perf_counter() - started
+    APP_STARTUP.set("startup", value=startup_time)
+    logger.info(f"Startup finished in {startup_time:.3f}s")
+    yield
+    app.state.ready = False
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    # Закрываем общий пул соединений к Supabase
+    await close_http_pool()
+
+
+app = FastAPI(title="Backend for eneca.work", lifespan=lifespan)
 
 
 # Добавляем обработчик исключений
@@ -61,6 +135,25 @@ async def digest_exception_handler(request: Request, exc: DigestBaseException):
     )
 
 
+@app.exception_handler(UpstreamUnavailableError)
+async def upstream_exception_handler(
+    request: Request, exc: UpstreamUnavailableError
+):
+    # Supabase недоступен: быстрый 503 вместо ожидания таймаутов
+    logger.error(f"Upstream unavailable: {str(exc)}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Сервис временно недоступен, повторите позже"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+# Сжатие ответов gzip/brotli
+app.add_middleware(
+    CompressionMiddleware, minimum_size=get_settings().compression_min_size
+)
+
+
 # Setup CORS
 app.add_middleware(
     CORSMiddleware,
@@ -71,13 +164,31 @@ app.add_middleware(
 )
 
 
+# Метрики латентности по маршрутам (внешний слой, чтобы учитывать все время)
+app.add_middleware(MetricsMiddleware)
+
+
 # Include routers
 app.include_router(auth_router, tags=["auth"])
 app.include_router(user_router, tags=["users"])
 app.include_router(digest_router, prefix="/api", tags=["digest"])
+app.include_router(health_router)
 
 
 # Server health check
 @app.get("/")
 async def health_check():
     return {"status": "healthy"}
+
+
+# Метрики в формате Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4"
+    )
+
+
+import_time = time.perf_counter() - _import_started
+APP_STARTUP.set("import", value=import_time)
+logger.info(f"Application imported in {import_time:.3f}s")
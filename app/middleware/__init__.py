@@ -0,0 +1,5 @@
+from .compression import CompressionMiddleware
+from .metrics import MetricsMiddleware
+
+
+__all__ = ("CompressionMiddleware", "MetricsMiddleware")
@@ -0,0 +1,200 @@
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, Request, status
+from app.cache import SharedStore, get_shared_store
+from app.config import get_settings
+from app.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITED = Counter(
+    "rate_limited_total",
+    "Requests rejected by the local rate limiter",
+    ("route", "key"),
+)
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Корзина на capacity запросов, которая полностью наполняется за period секунд"""
+
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> Optional["RateLimit"]:
+        """Разбор строки вида "5/minute"; пустая строка или "0" - без ограничения"""
+        value = value.strip()
+        if not value or value == "0":
+            return None
+        count, _, period = value.partition("/")
+        if period not in _PERIODS:
+            raise ValueError(f"Invalid rate limit: {value!r}")
+        return cls(int(count), _PERIODS[period])
+
+
+class MemoryBucketStore:
+    """
+    Корзины в памяти процесса. Число ключей ограничено: самые давно
+    использованные корзины вытесняются (забытая корзина считается полной).
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        """Забирает один токен; возвращает 0 или сколько секунд ждать следующего"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / limit.rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SharedBucketStore:
+    """
+    Корзины в общем для воркеров SharedStore, чтобы лимит действовал
+    на машину целиком, а не умножался на число воркеров.
+    """
+
+    # Как часто (в вызовах) удалять корзины, которые давно наполнились
+    PURGE_EVERY = 1000
+
+    def __init__(self, store: SharedStore):
+        self.store = store
+        self._calls = 0
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        try:
+            return self._take(key, limit)
+        except sqlite3.OperationalError as e:
+            # Хранилище занято дольше SHARED_CACHE_BUSY_TIMEOUT: не держим
+            # event loop и пропускаем запрос без лимита
+            logger.warning(f"Rate limit check skipped: {str(e)}")
+            return 0.0
+
+    def _take(self, key: str, limit: RateLimit) -> float:
+        now = time.time()
+        with self.store.lock:
+            connection = self.store.connection()
+            # IMMEDIATE: чтение и запись корзины - одна транзакция для всех процессов
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated = row or (limit.capacity, now)
+                tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+                if tokens >= 1:
+                    tokens, wait = tokens - 1, 0.0
+                else:
+                    wait = (1 - tokens) / limit.rate
+                connection.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) "
+                    "VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                self._calls += 1
+                if self._calls % self.PURGE_EVERY == 0:
+                    # Через сутки любая корзина заведомо полная
+                    connection.execute(
+                        "DELETE FROM rate_buckets WHERE updated < ?",
+                        (now - _PERIODS["day"],),
+                    )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return wait
+
+
+class RateLimiter:
+    def __init__(self, store=None):
+        self.store = store or MemoryBucketStore()
+        self.limits: Dict[Tuple[str, str], Optional[RateLimit]] = {}
+
+    def configure(self, route: str, ip: str = "", email: str = "") -> None:
+        self.limits[(route, "ip")] = RateLimit.parse(ip)
+        self.limits[(route, "email")] = RateLimit.parse(email)
+
+    def check(self, route: str, request: Request, email: Optional[str] = None) -> None:
+        """Проверка лимитов по IP и по email; при превышении - 429 с Retry-After"""
+        keys = [("ip", client_ip(request))]
+        if email:
+            # Адреса в ключах не храним
+            digest = hashlib.sha256(email.strip().casefold().encode()).hexdigest()
+            keys.append(("email", digest))
+
+        for kind, value in keys:
+            limit = self.limits.get((route, kind))
+            if limit is None:
+                continue
+            wait = self.store.take(f"{route}:{kind}:{value}", limit)
+            if wait > 0:
+                RATE_LIMITED.inc(route, kind)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests",
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+
+
+def client_ip(request: Request) -> str:
+    if get_settings().rate_limit_trust_proxy:
+        # Роутер дописывает адрес клиента в конец X-Forwarded-For; начало
+        # заголовка присылает сам клиент, поэтому берем последний адрес.
+        # Прокси uvicorn (forwarded_allow_ips) не подходит: он берет первый
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _build_limiter() -> RateLimiter:
+    settings = get_settings()
+    if settings.cache_backend == "shared":
+        limiter = RateLimiter(SharedBucketStore(get_shared_store()))
+    else:
+        limiter = RateLimiter()
+    if settings.rate_limit_enabled:
+        limiter.configure(
+            "login", settings.rate_limit_login_ip, settings.rate_limit_login_email
+        )
+        limiter.configure(
+            "register",
+            settings.rate_limit_register_ip,
+            settings.rate_limit_register_email,
+        )
+        limiter.configure(
+            "reset_password",
+            settings.rate_limit_reset_password_ip,
+            settings.rate_limit_reset_password_email,
+        )
+    return limiter
+
+
+rate_limiter = _build_limiter()
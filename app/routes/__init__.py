@@ -1,6 +1,7 @@
 from .auth import auth_router
 from .user import user_router
 from .digest import digest_router
+from .health import health_router
 
 
-__all__ = ("auth_router", "user_router", "digest_router")
+__all__ = ("auth_router", "user_router", "digest_router", "health_router")
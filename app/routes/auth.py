@@ -1,7 +1,12 @@
-from supabase import Client
 from app.services.auth import AuthServices
-from app.database import get_supabase, get_admin_client
-from fastapi import APIRouter, Depends, status
+from app.database import (
+    AsyncSupabase,
+    get_async_supabase,
+    get_async_admin_session_client,
+    get_async_session_client,
+)
+from fastapi import APIRouter, Depends, Request, status
+from app.ratelimit import rate_limiter
 from app.schemas.auth import (
     AuthRegisterRequest,
     AuthRegisterResponse,
@@ -53,8 +58,10 @@ auth_router = APIRouter(
         status.HTTP_429_TOO_MANY_REQUESTS: {"description": "Too many requests"},
     },
 )
-def register(
-    user_data: AuthRegisterRequest, supabase: Client = Depends(get_admin_client)
+async def register(
+    user_data: AuthRegisterRequest,
+    request: Request,
+    supabase: AsyncSupabase = Depends(get_async_admin_session_client),
 ) -> AuthRegisterResponse:
     """
     Register new user:
@@ -62,7 +69,10 @@ def register(
     - Create new user
     - Send email for confirmation
     """
-    result = AuthServices.register_user(supabase=supabase, **user_data.model_dump())
+    rate_limiter.check("register", request, user_data.email)
+    result = await AuthServices.register_user(
+        supabase=supabase, **user_data.model_dump()
+    )
     return result
 
 
@@ -82,15 +92,20 @@ def register(
         status.HTTP_429_TOO_MANY_REQUESTS: {"description": "Too many requests"},
     },
 )
-def login(
-    user_data: AuthLoginRequest, supabase: Client = Depends(get_supabase)
+async def login(
+    user_data: AuthLoginRequest,
+    request: Request,
+    supabase: AsyncSupabase = Depends(get_async_session_client),
 ) -> AuthLoginResponse:
     """
     Login to system:
     - Check credentials
     - Return access tokens on successful authentication
     """
-    result = AuthServices.login_user(supabase=supabase, **user_data.model_dump())
+    rate_limiter.check("login", request, user_data.email)
+    result = await AuthServices.login_user(
+        supabase=supabase, **user_data.model_dump()
+    )
     return result
 
 
@@ -104,15 +119,20 @@ def login(
         status.HTTP_429_TOO_MANY_REQUESTS: {"description": "Too many requests"},
     },
 )
-def reset_password(
-    user_data: AuthResetPasswordRequest, supabase: Client = Depends(get_supabase)
+async def reset_password(
+    user_data: AuthResetPasswordRequest,
+    request: Request,
+    supabase: AsyncSupabase = Depends(get_async_supabase),
 ) -> dict:
     """
     Request password reset:
     - Check if email exists
     - Send email with link to reset password
     """
-    result = AuthServices.reset_password(supabase=supabase, **user_data.model_dump())
+    rate_limiter.check("reset_password", request, user_data.email)
+    result = await AuthServices.reset_password(
+        supabase=supabase, **user_data.model_dump()
+    )
     return {"message": "Email with reset link sent"}
 
 
@@ -138,8 +158,9 @@ def reset_password(
         status.HTTP_401_UNAUTHORIZED: {"description": "Invalid token"},
     },
 )
-def update_password(
-    user_data: AuthUpdatePasswordRequest, supabase: Client = Depends(get_supabase)
+async def update_password(
+    user_data: AuthUpdatePasswordRequest,
+    supabase: AsyncSupabase = Depends(get_async_session_client),
 ) -> dict:
     """
     Update password:
@@ -147,7 +168,9 @@ def update_password(
     - Check new password
     - Update user password
     """
-    result = AuthServices.update_password(supabase=supabase, **user_data.model_dump())
+    result = await AuthServices.update_password(
+        supabase=supabase, **user_data.model_dump()
+    )
     return {"message": "Password updated successfully"}
 
 
@@ -167,13 +190,16 @@ def update_password(
         status.HTTP_429_TOO_MANY_REQUESTS: {"description": "Too many requests"},
     },
 )
-def refresh_token(
-    token_data: RefreshTokenRequest, supabase: Client = Depends(get_supabase)
+async def refresh_token(
+    token_data: RefreshTokenRequest,
+    supabase: AsyncSupabase = Depends(get_async_session_client),
 ) -> RefreshTokenResponse:
     """
     Refresh access token:
     - Check validity of refresh token
     - Return new access and refresh tokens
     """
-    result = AuthServices.refresh_token(supabase=supabase, **token_data.model_dump())
+    result = await AuthServices.refresh_token(
+        supabase=supabase, **token_data.model_dump()
+    )
     return result
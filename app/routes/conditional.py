@@ -0,0 +1,47 @@
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional
+from fastapi import Request, Response, status
+
+
+def validator_headers(
+    etag: str, last_modified: Optional[float], encoding: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Заголовки, по которым клиент сможет сделать условный запрос.
+    У сжатого представления ETag слабый, поэтому 304 и 200 должны
+    получать одну и ту же кодировку.
+    """
+    if encoding:
+        etag = f"W/{etag}"
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: Optional[float]
+) -> bool:
+    """Проверка If-None-Match / If-Modified-Since (RFC 9110, раздел 13.2.2)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def not_modified(
+    etag: str, last_modified: Optional[float], encoding: Optional[str] = None
+) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers=validator_headers(etag, last_modified, encoding),
+    )
@@ -1,9 +1,20 @@
-from fastapi import APIRouter, Depends, status
-from supabase import Client
-from typing import List
-from app.database import get_supabase
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+from app.compression import negotiate_encoding
+from app.database import AsyncSupabase, get_async_supabase
 from app.services.digest import DigestServices
-from app.schemas.digest import ProjectInfo, DigestResponse
+from app.services.digest_index import project_index
+from app.routes.conditional import is_not_modified, not_modified, validator_headers
+from app.schemas.digest import (
+    DigestFormat,
+    ProjectListItem,
+    DigestResponse,
+    DigestBatchRequest,
+    DigestBatchResponse,
+    DigestCalendarResponse,
+    DigestSearchResponse,
+)
 from app.exceptions.digest import (
     DigestDatabaseError,
     DigestAuthError,
@@ -40,6 +51,9 @@ ERROR_HANDLERS = {
     (DigestDatabaseError, DigestClientError): status.HTTP_400_BAD_REQUEST,
 }
 
+# Ответ из кэша после срока свежести (stale-while-revalidate)
+STALE_HEADER = "X-Cache-Status"
+
 digest_router = APIRouter(prefix="/digest",
                           tags=["digest"],
                           responses=ERROR_RESPONSES)
@@ -47,15 +61,58 @@ digest_router = APIRouter(prefix="/digest",
 
 @digest_router.get(
     "/projects",
-    response_model=List[ProjectInfo],
+    response_model=List[ProjectListItem],
     status_code=status.HTTP_200_OK,
     summary="Get unique projects list",
-    description="Get list of unique projects with their managers",
+    description="""
+    Get list of unique projects with their managers.
+    Without `limit` the whole list is returned. With `limit` the next page
+    cursor is returned in the `X-Next-Cursor` header.
+    Supports conditional requests with `If-None-Match` / `If-Modified-Since`.
+    Data past its freshness window is returned with `X-Cache-Status: STALE`
+    while it is refreshed in the background.
+
+    **Examples:**
+    - `/api/digest/projects?sort=-project_name&limit=50`
+    - `/api/digest/projects?fields=project_id,project_name&cursor=...`
+    """,
 )
-def get_projects(
-    supabase: Client = Depends(get_supabase)
-) -> List[ProjectInfo]:
-    return DigestServices.get_unique_projects(supabase=supabase)
+async def get_projects(
+    request: Request,
+    sort: str = Query(
+        default="project_id",
+        description="project_id, project_name or project_manager, '-' for desc",
+    ),
+    limit: Optional[int] = Query(default=None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(
+        default=None, description="Comma-separated list of fields to return"
+    ),
+    supabase: AsyncSupabase = Depends(get_async_supabase),
+) -> Response:
+    # Индекс проектов в памяти: 304 решается без обращения к Supabase
+    await DigestServices.get_unique_projects(supabase=supabase)
+    etag = DigestServices.projects_etag(str(request.query_params))
+    # CompressionMiddleware ослабляет ETag сжатого ответа; делаем это здесь
+    # при любой согласованной кодировке, чтобы 304 совпадал с 200
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if is_not_modified(request, etag, project_index.modified_at):
+        return not_modified(etag, project_index.modified_at, encoding)
+
+    items, next_cursor = await DigestServices.get_projects_page(
+        supabase=supabase,
+        sort=sort,
+        limit=limit,
+        cursor=cursor,
+        fields=[field.strip() for field in fields.split(",")] if fields else None,
+    )
+    headers = validator_headers(etag, project_index.modified_at, encoding)
+    if project_index.stale_for():
+        headers[STALE_HEADER] = "STALE"
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    # Отдаем готовые словари без повторной валидации каждой записи
+    return JSONResponse(content=items, headers=headers)
 
 
 @digest_router.get(
@@ -65,11 +122,21 @@ def get_projects(
     summary="Get digest markdown",
     description="""
     Get digest markdown by project ID and date.
-    If date is not provided, the current date will be used.
+    If date is not provided, yesterday's date will be used.
+    With `latest=true` the newest digest on or before the date is returned;
+    its actual date is in the `X-Digest-Date` header.
     
     **Examples:**
     - `/api/markdown/123` → gets digest for yesterday
     - `/api/markdown/123?digest_date=2024-03-20` → gets digest for the specified date
+    - `/api/markdown/123?latest=true` → gets the newest digest up to yesterday
+
+    With `format=html` the digest is rendered to sanitized HTML on the server
+    and returned as `{"digest_html": "..."}`.
+
+    Supports conditional requests with `If-None-Match` / `If-Modified-Since`.
+    Data past its freshness window is returned with `X-Cache-Status: STALE`
+    while it is refreshed in the background.
     """,
     responses={
         status.HTTP_404_NOT_FOUND: {
@@ -83,11 +150,162 @@ def get_projects(
         }
     },
 )
-def get_digest_text(
+async def get_digest_text(
     project_id: int,
-    digest_date: date = date.today() - timedelta(days=1),  # вчерашняя дата
-    supabase: Client = Depends(get_supabase),
-) -> DigestResponse:
-    return DigestServices.get_digest(
-        supabase=supabase, project_id=project_id, digest_date=digest_date
+    request: Request,
+    digest_date: Optional[date] = Query(
+        default=None, description="Digest date, yesterday by default"
+    ),
+    latest: bool = Query(
+        default=False, description="Newest digest on or before digest_date"
+    ),
+    format: DigestFormat = DigestFormat.MARKDOWN,
+    supabase: AsyncSupabase = Depends(get_async_supabase),
+) -> Response:
+    # Вчерашняя дата считается на каждый запрос, а не один раз при импорте
+    digest_date = digest_date or date.today() - timedelta(days=1)
+    # Закэшированный дайджест отдается вместе с валидаторами без запроса к базе
+    if latest:
+        digest_date, entry = await DigestServices.get_latest_digest_entry(
+            supabase=supabase, project_id=project_id, on_or_before=digest_date
+        )
+    else:
+        entry = await DigestServices.get_digest_entry(
+            supabase=supabase, project_id=project_id, digest_date=digest_date
+        )
+    stale = entry.stale_for() > 0
+    if format == DigestFormat.HTML:
+        entry = await DigestServices.get_digest_html(entry)
+    accept_encoding = request.headers.get("accept-encoding")
+    if is_not_modified(request, entry.etag, entry.last_modified):
+        encoding = entry.encoding_for(accept_encoding)
+        return not_modified(entry.etag, entry.last_modified, encoding)
+
+    # Сжатое тело берется из кэша, middleware его повторно не сжимает
+    body, encoding = await entry.encoded(accept_encoding)
+    headers = validator_headers(entry.etag, entry.last_modified, encoding)
+    headers["Vary"] = "Accept-Encoding"
+    headers["X-Digest-Date"] = digest_date.isoformat()
+    if stale:
+        headers[STALE_HEADER] = "STALE"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@digest_router.post(
+    "/batch",
+    response_model=DigestBatchResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Get digests for many projects",
+    description="""
+    Get digests for a list of projects for one date or a date range in one call.
+    Missing digests are returned with `found: false` instead of failing the call.
+    At most `DIGEST_BATCH_MAX_CELLS` project/date pairs per call;
+    use `/export` for larger ranges.
+    """,
+)
+async def get_digests_batch(
+    batch: DigestBatchRequest,
+    supabase: AsyncSupabase = Depends(get_async_supabase),
+) -> DigestBatchResponse:
+    return await DigestServices.get_digests_batch(
+        supabase=supabase, **batch.model_dump()
+    )
+
+
+@digest_router.get(
+    "/calendar",
+    response_model=DigestCalendarResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Get digest availability calendar",
+    description="""
+    Get the dates that have a digest for one, many or all projects over a range.
+    Served from memory without querying the database.
+    By default the range is the last year up to today.
+
+    **Examples:**
+    - `/api/digest/calendar?project_ids=123`
+    - `/api/digest/calendar?date_from=2024-01-01&date_to=2024-12-31`
+    """,
+)
+async def get_calendar(
+    project_ids: Optional[List[int]] = Query(default=None),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    supabase: AsyncSupabase = Depends(get_async_supabase),
+) -> DigestCalendarResponse:
+    return await DigestServices.get_calendar(
+        supabase=supabase,
+        project_ids=project_ids,
+        date_from=date_from,
+        date_to=date_to,
+    )
+
+
+@digest_router.get(
+    "/search",
+    response_model=DigestSearchResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Search digests",
+    description="""
+    Full-text search over digest texts, ranked by relevance (BM25).
+    Word forms are matched by stem, so `отчеты` also finds `отчетов`.
+    Each hit has a snippet around the matches, marked as `**word**`.
+    While the search index is being built after startup, the endpoint
+    returns 503 with a `Retry-After` header.
+
+    **Examples:**
+    - `/api/digest/search?q=согласование чертежей`
+    - `/api/digest/search?q=экспертиза&project_ids=123&date_from=2024-01-01`
+    """,
+)
+async def search_digests(
+    q: str = Query(..., min_length=1, max_length=500, description="Search query"),
+    project_ids: Optional[List[int]] = Query(default=None),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0, le=1000),
+    supabase: AsyncSupabase = Depends(get_async_supabase),
+) -> DigestSearchResponse:
+    return await DigestServices.search_digests(
+        supabase=supabase,
+        query=q,
+        limit=limit,
+        offset=offset,
+        project_ids=project_ids,
+        date_from=date_from,
+        date_to=date_to,
+    )
+
+
+@digest_router.get(
+    "/export",
+    status_code=status.HTTP_200_OK,
+    summary="Export digest history",
+    description="""
+    Stream digest history as NDJSON, one digest per line,
+    ordered by digest date and project ID.
+    If the database fails mid-stream, the last line is `{"error": "..."}`
+    and the connection is closed without completing the response.
+
+    **Examples:**
+    - `/api/digest/export` → exports the whole history
+    - `/api/digest/export?date_from=2024-01-01&project_ids=1&project_ids=2`
+    """,
+    response_class=StreamingResponse,
+)
+async def export_digests(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    project_ids: Optional[List[int]] = Query(default=None),
+    supabase: AsyncSupabase = Depends(get_async_supabase),
+) -> StreamingResponse:
+    stream = await DigestServices.export_digests(
+        supabase=supabase,
+        date_from=date_from,
+        date_to=date_to,
+        project_ids=project_ids,
     )
+    return StreamingResponse(stream, media_type="application/x-ndjson")
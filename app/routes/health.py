@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Request, status
+from fastapi.responses import JSONResponse
+from app.services.digest_index import project_index
+from app.services.health import health_monitor
+
+health_router = APIRouter(prefix="/health", tags=["health"])
+
+
+@health_router.get(
+    "/live",
+    summary="Liveness probe",
+    description="Process is up and the event loop is serving requests",
+)
+async def liveness() -> dict:
+    return {"status": "alive"}
+
+
+@health_router.get(
+    "/ready",
+    summary="Readiness probe",
+    description="Startup finished and the project index is loaded",
+    responses={status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Not ready"}},
+)
+async def readiness(request: Request) -> JSONResponse:
+    started = getattr(request.app.state, "ready", False)
+    ready = started and project_index.loaded
+    return JSONResponse(
+        status_code=(
+            status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+        content={
+            "status": "ready" if ready else "starting",
+            "startup_complete": started,
+            "project_index_loaded": project_index.loaded,
+        },
+    )
+
+
+@health_router.get(
+    "/deep",
+    summary="Deep health check",
+    description=(
+        "Upstream latency percentiles and error rates from the latest background "
+        "probes of PostgREST and GoTrue. Served from cache: the check itself "
+        "never calls Supabase"
+    ),
+    responses={
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Upstream is down"}
+    },
+)
+async def deep_health() -> JSONResponse:
+    report = health_monitor.current()
+    if report is None:
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={"status": "unknown", "upstreams": {}},
+        )
+    return JSONResponse(
+        status_code=(
+            status.HTTP_503_SERVICE_UNAVAILABLE
+            if report["status"] == "unhealthy"
+            else status.HTTP_200_OK
+        ),
+        content=report,
+    )
@@ -1,6 +1,5 @@
 from fastapi import APIRouter, Depends, status, Request
-from supabase import Client
-from app.database import get_admin_client
+from app.database import AsyncSupabase, get_async_admin_client
 from app.services.user import UserServices
 from app.schemas.user import UserInformationResponse
 
@@ -34,8 +33,9 @@ user_router = APIRouter(
         },
     },
 )
-def get_current_user(
-    request: Request, supabase: Client = Depends(get_admin_client)
+async def get_current_user(
+    request: Request,
+    supabase: AsyncSupabase = Depends(get_async_admin_client),
 ) -> UserInformationResponse:
     """
     Get current user data:
@@ -44,4 +44,6 @@ def get_current_user(
     - Get user ID from token
     - Return user data
     """
-    return UserServices.get_current_user_from_header(supabase=supabase, request=request)
+    return await UserServices.get_current_user_from_header(
+        supabase=supabase, request=request
+    )
@@ -1,5 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import date
+from enum import Enum
+from typing import List, Optional
 
 
 class ProjectInfo(BaseModel):
@@ -9,10 +11,75 @@ class ProjectInfo(BaseModel):
     project_manager_email: str
 
 
+class ProjectListItem(BaseModel):
+    """Элемент списка проектов; при выборе полей остальные отсутствуют"""
+
+    project_id: Optional[int] = None
+    project_name: Optional[str] = None
+    project_manager: Optional[str] = None
+    project_manager_email: Optional[str] = None
+
+
 class DigestRequest(BaseModel):
     project_id: int
     digest_date: date
 
 
+class DigestFormat(str, Enum):
+    MARKDOWN = "markdown"
+    HTML = "html"
+
+
 class DigestResponse(BaseModel):
     digest_text: str
+
+
+class DigestHtmlResponse(BaseModel):
+    digest_html: str
+
+
+class DigestBatchRequest(BaseModel):
+    project_ids: List[int] = Field(..., min_length=1, description="Project IDs")
+    date_from: date = Field(..., description="First digest date")
+    date_to: Optional[date] = Field(
+        default=None, description="Last digest date, defaults to date_from"
+    )
+
+
+class DigestBatchItem(BaseModel):
+    digest_date: date
+    found: bool
+    digest_text: Optional[str] = None
+
+
+class ProjectDigests(BaseModel):
+    project_id: int
+    digests: List[DigestBatchItem]
+
+
+class DigestBatchResponse(BaseModel):
+    projects: List[ProjectDigests]
+
+
+class ProjectAvailability(BaseModel):
+    project_id: int
+    dates: List[date]
+
+
+class DigestCalendarResponse(BaseModel):
+    date_from: date
+    date_to: date
+    projects: List[ProjectAvailability]
+
+
+class DigestSearchHit(BaseModel):
+    project_id: int
+    digest_date: date
+    score: float
+    snippet: str = Field(..., description="Fragment with matches marked as **word**")
+
+
+class DigestSearchResponse(BaseModel):
+    query: str
+    total: int = Field(..., description="Number of matching digests")
+    results: List[DigestSearchHit]
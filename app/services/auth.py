@@ -1,17 +1,36 @@
+import hashlib
 from gotrue.errors import AuthApiError
 from app.schemas.auth import AuthRegisterResponse, AuthLoginResponse, RefreshTokenResponse
 from fastapi import HTTPException, status
 import logging
-from supabase import Client
+from app.cache import create_cache
+from app.config import get_settings
+from app.database import AsyncSupabase
+from app.singleflight import SingleFlight
+from app.upstream import upstream_call
+from app.services.user import UserServices
 
 logger = logging.getLogger(__name__)
 
+# Клиенты часто обновляют токен одновременно из нескольких вкладок: один
+# refresh-токен дает одну пару, которую получают все параллельные запросы.
+# Пары токенов - секреты, поэтому кэш всегда в памяти процесса, а не в общем
+# файле; повторы на других воркерах покрывает окно повторного использования
+# refresh-токена в GoTrue
+refresh_flights = SingleFlight()
+refresh_cache = create_cache(
+    "refresh_tokens",
+    maxsize=10000,
+    ttl=get_settings().refresh_result_ttl,
+    shared=False,
+)
+
 
 class AuthServices:
 
     @staticmethod
-    def register_user(
-        supabase: Client,
+    async def register_user(
+        supabase: AsyncSupabase,
         first_name: str,
         last_name: str,
         department: str,
@@ -23,7 +42,9 @@ class AuthServices:
         password_confirm: str,
     ) -> AuthRegisterResponse:
         try:
-            auth_response = supabase.auth.sign_up(
+            auth_response = await upstream_call(
+                "auth.sign_up",
+                supabase.auth.sign_up,
                 {
                     "email": email,
                     "password": password,
@@ -58,7 +79,10 @@ class AuthServices:
                 "category": category,
             }
 
-            response = supabase.from_("users").insert(user_data).execute()
+            response = await upstream_call(
+                "users.insert", supabase.from_("users").insert(user_data).execute
+            )
+            UserServices.invalidate_user(auth_response.user.id)
 
             return AuthRegisterResponse(
                 first_name=auth_response.user.user_metadata.get("first_name"),
@@ -85,8 +109,8 @@ class AuthServices:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     @staticmethod
-    def login_user(
-        supabase: Client,
+    async def login_user(
+        supabase: AsyncSupabase,
         email: str,
         password: str,
     ) -> AuthLoginResponse:
@@ -94,7 +118,9 @@ class AuthServices:
             logger.info(f"Login attempt for user: {email}")
             
             # Вместо использования options, мы будем использовать базовую аутентификацию
-            auth_response = supabase.auth.sign_in_with_password(
+            auth_response = await upstream_call(
+                "auth.sign_in",
+                supabase.auth.sign_in_with_password,
                 {"email": email, "password": password}
             )
 
@@ -132,9 +158,11 @@ class AuthServices:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     @staticmethod
-    def reset_password(supabase: Client, email: str) -> dict:
+    async def reset_password(supabase: AsyncSupabase, email: str) -> dict:
         try:
-            supabase.auth.reset_password_email(email)
+            await upstream_call(
+                "auth.reset_password", supabase.auth.reset_password_email, email
+            )
             return {"message": "Email with reset link sent"}
 
         except AuthApiError as e:
@@ -149,16 +177,25 @@ class AuthServices:
             )
 
     @staticmethod
-    def update_password(
-        supabase: Client,
+    async def update_password(
+        supabase: AsyncSupabase,
         access_token: str,
         refresh_token: str,
         password: str,
         password_confirm: str,
     ) -> dict:
         try:
-            supabase.auth.set_session(access_token, refresh_token)
-            supabase.auth.update_user({"password": password})
+            await upstream_call(
+                "auth.set_session",
+                supabase.auth.set_session,
+                access_token,
+                refresh_token,
+            )
+            await upstream_call(
+                "auth.update_user",
+                supabase.auth.update_user,
+                {"password": password},
+            )
             return {"message": "Password updated successfully"}
 
         except AuthApiError as e:
@@ -175,15 +212,35 @@ class AuthServices:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     @staticmethod
-    def refresh_token(
-        supabase: Client,
+    async def refresh_token(
+        supabase: AsyncSupabase,
+        refresh_token: str,
+    ) -> RefreshTokenResponse:
+        # Сам токен в ключах не храним
+        key = hashlib.sha256(refresh_token.encode()).hexdigest()
+        cached = refresh_cache.get(key)
+        if cached is not None:
+            logger.info("Token refresh served from recent result")
+            return cached
+
+        result = await refresh_flights.do(
+            key, AuthServices._refresh_token, supabase, refresh_token
+        )
+        refresh_cache.set(key, result)
+        return result
+
+    @staticmethod
+    async def _refresh_token(
+        supabase: AsyncSupabase,
         refresh_token: str,
     ) -> RefreshTokenResponse:
         try:
             logger.info(f"Token refresh attempt")
             
             # Обновляем токен без использования options
-            auth_response = supabase.auth.refresh_session(refresh_token)
+            auth_response = await upstream_call(
+                "auth.refresh_session", supabase.auth.refresh_session, refresh_token
+            )
             
             if not auth_response.session:
                 logger.warning("Token refresh failed - No session in response")
@@ -1,8 +1,45 @@
+import base64
+import hashlib
+import json
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
 import logging
-from datetime import date
-from typing import List
-from supabase import Client
-from app.schemas.digest import ProjectInfo, DigestResponse
+from datetime import date, timedelta
+from enum import Enum
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from app.cache import create_cache
+from app.compression import compress, negotiate_encoding
+from app.config import get_settings
+from app.database import AsyncSupabase
+from app.upstream import upstream_call
+from app.services.digest_index import (
+    PROJECT_COLUMNS,
+    PROJECT_SORT_FIELDS,
+    iter_digest_rows,
+    project_index,
+)
+from app.services.render import render_markdown
+from app.services.search import (
+    SEARCH_WARMUP_RETRY_AFTER,
+    make_snippet,
+    search_index,
+)
+from app.singleflight import SingleFlight
+from starlette.concurrency import run_in_threadpool
+from app.schemas.digest import (
+    ProjectInfo,
+    DigestResponse,
+    DigestHtmlResponse,
+    DigestBatchItem,
+    DigestBatchResponse,
+    DigestCalendarResponse,
+    DigestSearchHit,
+    DigestSearchResponse,
+    ProjectAvailability,
+    ProjectDigests,
+)
 from app.exceptions.digest import (
     DigestNotFoundException,
     ProjectNotFoundException,
@@ -10,36 +47,132 @@ from app.exceptions.digest import (
     DigestAuthError,
     DigestValidationError,
 )
+from app.exceptions.upstream import UpstreamUnavailableError
 from postgrest.exceptions import APIError
 from gotrue.errors import AuthApiError
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Кэш дайджестов по ключу (project_id, digest_date)
+digest_cache = create_cache(
+    "digests",
+    maxsize=settings.digest_cache_size,
+    ttl=settings.digest_cache_ttl_past,
+)
+# Отрендеренный HTML по хэшу содержимого markdown: одинаковый текст
+# рендерится один раз, сколько бы проектов и дат на него ни ссылалось
+digest_html_cache = create_cache(
+    "digest_html",
+    maxsize=settings.digest_html_cache_size,
+    ttl=settings.digest_cache_ttl_past,
+)
+
+# Чтения дайджестов из базы: один запрос на ключ, сколько бы клиентов его ни ждали
+digest_flights = SingleFlight()
+
+
+class _CacheMarker(Enum):
+    # Член Enum сохраняет тождественность после pickle в общем кэше
+    MISSING = "missing"
+
+
+# Маркер закэшированного отсутствия дайджеста
+DIGEST_MISSING = _CacheMarker.MISSING
+
+
+@dataclass
+class CachedDigest:
+    """Дайджест в кэше вместе с готовым телом ответа и валидаторами"""
+
+    digest_text: str
+    body: bytes
+    etag: str
+    last_modified: float
+    # Сжатые варианты тела, считаются один раз на запись кэша
+    variants: Dict[str, bytes] = field(default_factory=dict)
+    # После этого момента запись еще отдается, но перечитывается в фоне
+    fresh_until: float = float("inf")
+
+    def stale_for(self) -> float:
+        """Сколько секунд назад запись перестала быть свежей (0 - свежая)"""
+        return max(0.0, time.time() - self.fresh_until)
+
+    @classmethod
+    def build(
+        cls, digest_text: str, body: Optional[bytes] = None, last_modified=None
+    ) -> "CachedDigest":
+        if body is None:
+            body = DigestResponse(digest_text=digest_text).model_dump_json().encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        return cls(digest_text, body, etag, last_modified or time.time())
+
+    def encoding_for(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """Кодировка, в которой будет отдано тело, без самого сжатия"""
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None or len(self.body) < settings.compression_min_size:
+            return None
+        return encoding
+
+    async def encoded(
+        self, accept_encoding: Optional[str]
+    ) -> Tuple[bytes, Optional[str]]:
+        """Тело в лучшей из принимаемых клиентом кодировок"""
+        encoding = self.encoding_for(accept_encoding)
+        if encoding is None:
+            return self.body, None
+        if encoding not in self.variants:
+            # Сжатие нагружает CPU, не блокируем event loop
+            self.variants[encoding] = await run_in_threadpool(
+                compress, self.body, encoding, True
+            )
+        return self.variants[encoding], encoding
 
 
 class DigestServices:
     @staticmethod
-    def get_unique_projects(supabase: Client) -> List[ProjectInfo]:
-        try:
-            query = (
-                supabase.from_("digest_reports")
-                .select(
-                    "project_id, project_name, project_manager, "
-                    "project_manager_email"
-                )
-                .execute()
+    def _digest_ttl(digest_date: date) -> float:
+        # Дайджест за сегодня (или будущую дату) еще может появиться или измениться
+        if digest_date >= date.today():
+            return settings.digest_cache_ttl_today
+        return settings.digest_cache_ttl_past
+
+    @staticmethod
+    def _remember(
+        project_id: int, digest_date: date, digest_text: Optional[str]
+    ) -> Optional[CachedDigest]:
+        """Кладем в кэш найденный дайджест или факт его отсутствия"""
+        cache_key = (project_id, digest_date)
+        if digest_text is None:
+            digest_cache.set(
+                cache_key, DIGEST_MISSING, ttl=settings.digest_cache_ttl_missing
             )
+            return None
+        entry = CachedDigest.build(digest_text)
+        previous = digest_cache.get(cache_key)
+        if isinstance(previous, CachedDigest) and previous.etag == entry.etag:
+            # Содержимое не изменилось - Last-Modified и сжатые варианты
+            # остаются прежними, иначе перечитывание и прогрев сбивали бы
+            # If-Modified-Since клиентов и заново сжимали бы тело
+            entry.last_modified = previous.last_modified
+            entry.variants = previous.variants
+        ttl = DigestServices._digest_ttl(digest_date)
+        entry.fresh_until = time.time() + ttl
+        # Запись живет дольше срока свежести на допустимое время устаревания
+        digest_cache.set(cache_key, entry, ttl=ttl + settings.stale_max_age)
+        return entry
 
-            # Создаем множество для хранения уникальных проектов
-            unique_projects = {}
-            for item in query.data:
-                project_id = item["project_id"]
-                if project_id not in unique_projects:
-                    unique_projects[project_id] = ProjectInfo(**item)
+    @staticmethod
+    async def get_unique_projects(supabase: AsyncSupabase) -> List[ProjectInfo]:
+        try:
+            # Список берется из индекса, который обновляется в фоне
+            await project_index.ensure_fresh(supabase)
+            projects = project_index.projects()
 
             # 0 означает, что не найдено ни одного проекта
-            if not unique_projects:
+            if not projects:
                 raise ProjectNotFoundException(0)
-            return list(unique_projects.values())
+            return projects
 
         except APIError as e:
             logger.error(f"PostgREST API error: {str(e)}")
@@ -54,22 +187,125 @@ class DigestServices:
             raise DigestValidationError("обработке данных проектов", str(e))
 
     @staticmethod
-    def get_digest(
-        supabase: Client, project_id: int, digest_date: date
-    ) -> DigestResponse:
+    def projects_etag(query: str) -> str:
+        """ETag списка проектов: содержимое индекса плюс параметры запроса"""
+        raw = f"{project_index.etag}:{query}".encode("utf-8")
+        return f'"{hashlib.sha256(raw).hexdigest()[:32]}"'
+
+    @staticmethod
+    async def get_projects_page(
+        supabase: AsyncSupabase,
+        sort: str = "project_id",
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Страница списка проектов с сортировкой и выбором полей.
+        sort с префиксом "-" сортирует по убыванию; cursor - значение
+        из заголовка X-Next-Cursor предыдущей страницы.
+        """
+        descending = sort.startswith("-")
+        sort_field = sort.lstrip("-")
+        if sort_field not in PROJECT_SORT_FIELDS:
+            raise DigestValidationError(
+                "получении списка проектов", f"нельзя сортировать по {sort_field}"
+            )
+        fields = fields or list(PROJECT_COLUMNS)
+        unknown = set(fields) - set(PROJECT_COLUMNS)
+        if unknown:
+            raise DigestValidationError(
+                "получении списка проектов",
+                f"неизвестные поля: {', '.join(sorted(unknown))}",
+            )
+
+        await DigestServices.get_unique_projects(supabase)
+        keys, projects = project_index.sorted_by(sort_field)
+        after = DigestServices._decode_cursor(cursor, sort_field) if cursor else None
+
+        # Keyset по отсортированному списку: ищем позицию курсора бинарным поиском
+        if descending:
+            end = bisect_left(keys, after) if after else len(keys)
+            start = max(0, end - limit) if limit else 0
+            page = projects[start:end][::-1]
+            last, has_more = start, start > 0
+        else:
+            start = bisect_right(keys, after) if after else 0
+            end = min(start + limit, len(keys)) if limit else len(keys)
+            page = projects[start:end]
+            last, has_more = end - 1, end < len(keys)
+
+        next_cursor = None
+        if page and has_more:
+            next_cursor = DigestServices._encode_cursor(sort_field, keys[last])
+        items = [
+            {field: getattr(project, field) for field in fields} for project in page
+        ]
+        return items, next_cursor
+
+    @staticmethod
+    def _encode_cursor(sort_field: str, key: tuple) -> str:
+        # Поле сортировки в курсоре не дает применить его к другой сортировке
+        raw = json.dumps([sort_field, *key], ensure_ascii=False).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str, sort_field: str) -> tuple:
         try:
-            query = (
-                supabase.from_("digest_reports")
-                .select("digest_text")
-                .filter("project_id", "eq", project_id)
-                .filter("digest_date", "eq", digest_date.isoformat())
-                .execute()
+            field, value, project_id = json.loads(base64.urlsafe_b64decode(cursor))
+        except (ValueError, TypeError):
+            raise DigestValidationError("получении списка проектов", "неверный курсор")
+        if field != sort_field:
+            raise DigestValidationError(
+                "получении списка проектов", "курсор выдан для другой сортировки"
             )
+        # Значение сравнивается с ключами индекса, тип должен совпадать
+        value_type = int if sort_field == "project_id" else str
+        for item, expected in ((value, value_type), (project_id, int)):
+            if type(item) is not expected:
+                raise DigestValidationError(
+                    "получении списка проектов", "неверный курсор"
+                )
+        return (value, project_id)
 
-            if not query.data:
-                raise DigestNotFoundException(project_id, digest_date)
+    @staticmethod
+    async def get_digest_entry(
+        supabase: AsyncSupabase, project_id: int, digest_date: date
+    ) -> CachedDigest:
+        """
+        Дайджест с готовым телом ответа и валидаторами ETag/Last-Modified.
+        Устаревшая запись отдается сразу, а перечитывается одной фоновой
+        задачей; если база недоступна, клиенты получают устаревшую запись,
+        пока не истечет STALE_MAX_AGE.
+        """
+        cache_key = (project_id, digest_date)
+        cached = digest_cache.get(cache_key)
+        if cached is DIGEST_MISSING:
+            raise DigestNotFoundException(project_id, digest_date)
+        if cached is not None:
+            if cached.stale_for() > 0:
+                # Свой ключ: холодное чтение, пришедшее во время перечитывания,
+                # не должно получить None от фоновой задачи
+                digest_flights.spawn(
+                    ("revalidate", *cache_key),
+                    DigestServices._revalidate_digest,
+                    supabase,
+                    project_id,
+                    digest_date,
+                )
+            return cached
 
-            return DigestResponse(digest_text=query.data[0]["digest_text"])
+        try:
+            entry = await digest_flights.do(
+                cache_key,
+                DigestServices._fetch_digest,
+                supabase,
+                project_id,
+                digest_date,
+            )
+            if entry is None:
+                raise DigestNotFoundException(project_id, digest_date)
+            return entry
 
         except APIError as e:
             # Ошибки PostgREST API
@@ -79,9 +315,383 @@ class DigestServices:
         except AuthApiError as e:
             # Ошибки аутентификации
             logger.error(f"Authentication error: {str(e)}")
-            raise DigestAuthError("проверке доступа к дайджесту", str(e))
+            raise DigestAuthError("проверке доступа к дайджесту")
 
         except ValueError as e:
             # Ошибки валидации данных
             logger.error(f"Data validation error: {str(e)}")
             raise DigestValidationError("обработке данных дайджеста", str(e))
+
+    @staticmethod
+    async def get_latest_digest_entry(
+        supabase: AsyncSupabase, project_id: int, on_or_before: date
+    ) -> Tuple[date, CachedDigest]:
+        """
+        Самый свежий дайджест проекта не позже указанной даты - один запрос
+        с сортировкой по убыванию даты вместо перебора дат с 404.
+        Возвращает фактическую дату дайджеста и запись кэша.
+        """
+        pointer_key = (project_id, on_or_before, "latest")
+        resolved = digest_cache.get(pointer_key)
+        if resolved is DIGEST_MISSING:
+            raise DigestNotFoundException(project_id, on_or_before)
+        if resolved is not None:
+            cached = digest_cache.get((project_id, resolved))
+            if isinstance(cached, CachedDigest):
+                return resolved, cached
+
+        try:
+            request = (
+                supabase.from_("digest_reports")
+                .select("digest_date, digest_text")
+                .filter("project_id", "eq", project_id)
+                .filter("digest_date", "lte", on_or_before.isoformat())
+                # Строка с пустым текстом - не дайджест, берем предыдущую дату
+                .filter("digest_text", "not.is", "null")
+                .order("digest_date", desc=True)
+                .limit(1)
+            )
+            query = await upstream_call("digest_reports.latest", request.execute)
+
+        except APIError as e:
+            logger.error(f"PostgREST API error: {str(e)}")
+            raise DigestDatabaseError("поиске последнего дайджеста", str(e))
+
+        except AuthApiError as e:
+            logger.error(f"Authentication error: {str(e)}")
+            raise DigestAuthError("проверке доступа к дайджесту")
+
+        if not query.data:
+            digest_cache.set(
+                pointer_key, DIGEST_MISSING, ttl=settings.digest_cache_ttl_missing
+            )
+            raise DigestNotFoundException(project_id, on_or_before)
+
+        row = query.data[0]
+        resolved = date.fromisoformat(row["digest_date"])
+        entry = DigestServices._remember(project_id, resolved, row["digest_text"])
+        # Дайджест за запрошенную дату может появиться позже - тогда
+        # указатель живет не дольше закэшированного отсутствия
+        if resolved == on_or_before:
+            ttl = DigestServices._digest_ttl(on_or_before)
+        else:
+            ttl = settings.digest_cache_ttl_missing
+        digest_cache.set(pointer_key, resolved, ttl=ttl)
+        return resolved, entry
+
+    @staticmethod
+    async def _fetch_digest(
+        supabase: AsyncSupabase, project_id: int, digest_date: date
+    ) -> Optional[CachedDigest]:
+        """Читает дайджест из базы и кладет результат (или его отсутствие) в кэш"""
+        request = (
+            supabase.from_("digest_reports")
+            .select("digest_text")
+            .filter("project_id", "eq", project_id)
+            .filter("digest_date", "eq", digest_date.isoformat())
+        )
+        query = await upstream_call("digest_reports.get", request.execute)
+        digest_text = query.data[0]["digest_text"] if query.data else None
+        return DigestServices._remember(project_id, digest_date, digest_text)
+
+    @staticmethod
+    async def _revalidate_digest(
+        supabase: AsyncSupabase, project_id: int, digest_date: date
+    ) -> None:
+        try:
+            await DigestServices._fetch_digest(supabase, project_id, digest_date)
+        except Exception as e:
+            # Устаревшая запись остается в кэше и продолжает отдаваться
+            logger.warning(
+                f"Digest revalidation failed for {project_id}/{digest_date}: {str(e)}"
+            )
+
+    @staticmethod
+    async def get_digest_html(entry: CachedDigest) -> CachedDigest:
+        """HTML-представление дайджеста из кэша по хэшу содержимого"""
+        rendered = digest_html_cache.get(entry.etag)
+        if rendered is None:
+            # Рендеринг нагружает CPU, не блокируем event loop
+            html = await run_in_threadpool(render_markdown, entry.digest_text)
+            body = DigestHtmlResponse(digest_html=html).model_dump_json().encode()
+            rendered = CachedDigest.build(
+                entry.digest_text, body=body, last_modified=entry.last_modified
+            )
+            digest_html_cache.set(entry.etag, rendered)
+        return rendered
+
+    @staticmethod
+    async def get_digests_batch(
+        supabase: AsyncSupabase,
+        project_ids: List[int],
+        date_from: date,
+        date_to: Optional[date] = None,
+    ) -> DigestBatchResponse:
+        date_to = date_to or date_from
+        project_ids = list(dict.fromkeys(project_ids))
+        days = (date_to - date_from).days + 1
+        if days < 1:
+            raise DigestValidationError(
+                "получении дайджестов", "date_to раньше date_from"
+            )
+        if days > settings.digest_batch_max_days:
+            raise DigestValidationError(
+                "получении дайджестов",
+                f"период больше {settings.digest_batch_max_days} дней",
+            )
+        if len(project_ids) > settings.digest_batch_max_projects:
+            raise DigestValidationError(
+                "получении дайджестов",
+                f"больше {settings.digest_batch_max_projects} проектов",
+            )
+        if len(project_ids) * days > settings.digest_batch_max_cells:
+            # Весь ответ собирается в памяти: ограничиваем число дайджестов
+            raise DigestValidationError(
+                "получении дайджестов",
+                f"больше {settings.digest_batch_max_cells} пар проект-дата, "
+                "используйте /export",
+            )
+
+        dates = [date_from + timedelta(days=offset) for offset in range(days)]
+        texts = {}
+        pending = []
+        for project_id in project_ids:
+            for digest_date in dates:
+                cached = digest_cache.get((project_id, digest_date))
+                if cached is None:
+                    pending.append((project_id, digest_date))
+                elif cached is not DIGEST_MISSING:
+                    texts[(project_id, digest_date)] = cached.digest_text
+
+        # Все, чего нет в кэше, забираем одним запросом с фильтром in/диапазон
+        if pending:
+            fetched = {}
+            async for row in iter_digest_rows(
+                supabase,
+                ("digest_text",),
+                since=min(digest_date for _, digest_date in pending),
+                until=max(digest_date for _, digest_date in pending),
+                project_ids=sorted({project_id for project_id, _ in pending}),
+            ):
+                row_date = date.fromisoformat(row["digest_date"])
+                fetched[(row["project_id"], row_date)] = row["digest_text"]
+            # В кэш кладем только пакет за один день (как при прогреве): период
+            # по многим проектам вытеснил бы из кэша часто запрашиваемые дайджесты
+            remember = days == 1
+            for key in pending:
+                if remember:
+                    DigestServices._remember(*key, fetched.get(key))
+                if key in fetched:
+                    texts[key] = fetched[key]
+
+        return DigestBatchResponse(
+            projects=[
+                ProjectDigests(
+                    project_id=project_id,
+                    digests=[
+                        DigestBatchItem(
+                            digest_date=digest_date,
+                            found=texts.get((project_id, digest_date)) is not None,
+                            digest_text=texts.get((project_id, digest_date)),
+                        )
+                        for digest_date in dates
+                    ],
+                )
+                for project_id in project_ids
+            ]
+        )
+
+    @staticmethod
+    async def get_calendar(
+        supabase: AsyncSupabase,
+        project_ids: Optional[List[int]] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> DigestCalendarResponse:
+        """
+        Даты, за которые есть дайджесты, по проектам. Отвечает из битсетов
+        индекса проектов; без project_ids - по всем известным проектам.
+        """
+        date_to = date_to or date.today()
+        date_from = date_from or date_to - timedelta(days=365)
+        days = (date_to - date_from).days + 1
+        if days < 1:
+            raise DigestValidationError(
+                "получении календаря дайджестов", "date_to раньше date_from"
+            )
+        if days > settings.digest_calendar_max_days:
+            raise DigestValidationError(
+                "получении календаря дайджестов",
+                f"период больше {settings.digest_calendar_max_days} дней",
+            )
+
+        await DigestServices.get_unique_projects(supabase)
+        if project_ids is None:
+            project_ids = [
+                project.project_id for project in project_index.projects()
+            ]
+        return DigestCalendarResponse(
+            date_from=date_from,
+            date_to=date_to,
+            projects=[
+                ProjectAvailability(
+                    project_id=project_id,
+                    dates=project_index.available_dates(
+                        project_id, date_from, date_to
+                    ),
+                )
+                for project_id in dict.fromkeys(project_ids)
+            ],
+        )
+
+    @staticmethod
+    async def search_digests(
+        supabase: AsyncSupabase,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        project_ids: Optional[List[int]] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> DigestSearchResponse:
+        """
+        Полнотекстовый поиск по индексу в памяти. В базу ходим только
+        за текстами найденной страницы для сниппетов, одним запросом.
+        """
+        if not settings.search_enabled:
+            raise DigestValidationError("поиске дайджестов", "поиск выключен")
+        if date_from and date_to and date_to < date_from:
+            raise DigestValidationError(
+                "поиске дайджестов", "date_to раньше date_from"
+            )
+        if not search_index.loaded:
+            # Индекс строится фоновой задачей: не держим запрос на все время
+            # построения, а просим повторить позже
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Поиск еще не готов, повторите позже",
+                headers={"Retry-After": str(SEARCH_WARMUP_RETRY_AFTER)},
+            )
+
+        # Проход по спискам вхождений - секунды CPU на больших индексах
+        total, page, terms = await run_in_threadpool(
+            search_index.search,
+            query,
+            limit=limit,
+            offset=offset,
+            project_ids=project_ids,
+            date_from=date_from,
+            date_to=date_to,
+        )
+        texts = await DigestServices._get_snippet_texts(
+            supabase, [(project_id, digest_date) for _, project_id, digest_date in page]
+        )
+
+        def build_hits() -> List[DigestSearchHit]:
+            return [
+                DigestSearchHit(
+                    project_id=project_id,
+                    digest_date=digest_date,
+                    score=round(score, 4),
+                    snippet=make_snippet(texts[(project_id, digest_date)], terms),
+                )
+                for score, project_id, digest_date in page
+                # Дайджест удален после индексации
+                if (project_id, digest_date) in texts
+            ]
+
+        return DigestSearchResponse(
+            query=query, total=total, results=await run_in_threadpool(build_hits)
+        )
+
+    @staticmethod
+    async def _get_snippet_texts(
+        supabase: AsyncSupabase, keys: List[Tuple[int, date]]
+    ) -> Dict[Tuple[int, date], str]:
+        """
+        Тексты дайджестов для сниппетов: что есть в кэше - из кэша, остальное
+        одним запросом. Прочитанное в кэш не кладем, чтобы случайные
+        результаты поиска не вытесняли часто запрашиваемые дайджесты.
+        """
+        texts = {}
+        missing = []
+        for key in keys:
+            cached = digest_cache.get(key)
+            if isinstance(cached, CachedDigest):
+                texts[key] = cached.digest_text
+            elif cached is None:
+                missing.append(key)
+        if not missing:
+            return texts
+
+        # in по проектам и датам отбирает строки по индексу, а or - точные пары
+        pairs = ",".join(
+            f"and(project_id.eq.{project_id},digest_date.eq.{digest_date})"
+            for project_id, digest_date in missing
+        )
+        request = (
+            supabase.from_("digest_reports")
+            .select("project_id, digest_date, digest_text")
+            .in_("project_id", sorted({project_id for project_id, _ in missing}))
+            .in_("digest_date", sorted({day.isoformat() for _, day in missing}))
+            .or_(pairs)
+        )
+        try:
+            query = await upstream_call("digest_reports.snippets", request.execute)
+        except APIError as e:
+            logger.error(f"PostgREST API error: {str(e)}")
+            raise DigestDatabaseError("получении текстов для поиска", str(e))
+
+        wanted = set(missing)
+        for row in query.data:
+            key = (row["project_id"], date.fromisoformat(row["digest_date"]))
+            if key in wanted and row["digest_text"] is not None:
+                texts[key] = row["digest_text"]
+        return texts
+
+    @staticmethod
+    async def export_digests(
+        supabase: AsyncSupabase,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        project_ids: Optional[List[int]] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Возвращает поток NDJSON-строк с историей дайджестов.
+        Первая страница читается до начала ответа, чтобы ошибки базы
+        вернулись клиенту обычным статусом, а не оборванным потоком.
+        Ошибка на следующих страницах завершает поток строкой {"error": ...}
+        и обрывом соединения.
+        """
+        rows = iter_digest_rows(
+            supabase,
+            (*PROJECT_COLUMNS, "digest_text"),
+            since=date_from,
+            until=date_to,
+            project_ids=project_ids,
+            page_size=settings.digest_export_page_size,
+        )
+        try:
+            first = await rows.__anext__()
+        except StopAsyncIteration:
+            first = None
+
+        async def stream() -> AsyncIterator[bytes]:
+            if first is None:
+                return
+            yield DigestServices._ndjson(first)
+            try:
+                async for row in rows:
+                    yield DigestServices._ndjson(row)
+            except (DigestDatabaseError, UpstreamUnavailableError) as e:
+                # Заголовки уже отправлены: последней строкой сообщаем об ошибке
+                # и обрываем поток, чтобы неполная выгрузка не выглядела полной
+                logger.error(f"Digest export interrupted: {str(e)}")
+                yield DigestServices._ndjson({"error": "Выгрузка прервана"})
+                raise
+
+        return stream()
+
+    @staticmethod
+    def _ndjson(row: dict) -> bytes:
+        return (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from datetime import date
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from postgrest.exceptions import APIError
+from app.cache import create_cache
+from app.config import get_settings
+from app.database import AsyncSupabase
+from app.schemas.digest import ProjectInfo
+from app.exceptions.digest import DigestDatabaseError
+from app.singleflight import SingleFlight
+from app.upstream import upstream_call
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+PROJECT_COLUMNS = (
+    "project_id",
+    "project_name",
+    "project_manager",
+    "project_manager_email",
+)
+# Поля, по которым можно сортировать список проектов
+PROJECT_SORT_FIELDS = ("project_id", "project_name", "project_manager")
+
+# Снимок индекса и аренда на его обновление. При общем кэше индекс
+# читает из базы один воркер, остальные берут опубликованный снимок
+index_store = create_cache("project_index", maxsize=4, ttl=86400)
+INDEX_LEASE_TTL = 120
+
+
+def project_sort_key(project: ProjectInfo, field: str) -> tuple:
+    """Ключ сортировки; project_id делает его уникальным для курсора"""
+    value = getattr(project, field)
+    if isinstance(value, str):
+        value = value.casefold()
+    return (value, project.project_id)
+
+
+async def iter_digest_rows(
+    supabase: AsyncSupabase,
+    columns: Iterable[str],
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    project_ids: Optional[Iterable[int]] = None,
+    page_size: int = 1000,
+) -> AsyncIterator[dict]:
+    """
+    Обходит digest_reports постранично по ключу (digest_date, project_id).
+    Keyset-пагинация не замедляется с ростом истории, а в памяти
+    одновременно находится только одна страница.
+    """
+    if project_ids is not None:
+        project_ids = list(project_ids)
+    select = ", ".join(dict.fromkeys(("digest_date", "project_id", *columns)))
+    cursor = None
+    while True:
+        query = (
+            supabase.from_("digest_reports")
+            .select(select)
+            .order("digest_date")
+            .order("project_id")
+            .limit(page_size)
+        )
+        if since is not None:
+            query = query.gte("digest_date", since.isoformat())
+        if until is not None:
+            query = query.lte("digest_date", until.isoformat())
+        if project_ids is not None:
+            query = query.in_("project_id", project_ids)
+        if cursor is not None:
+            last_date, last_project = cursor
+            query = query.or_(
+                f"digest_date.gt.{last_date},"
+                f"and(digest_date.eq.{last_date},project_id.gt.{last_project})"
+            )
+        try:
+            response = await upstream_call("digest_reports.scan", query.execute)
+        except APIError as e:
+            logger.error(f"PostgREST API error: {str(e)}")
+            raise DigestDatabaseError("чтении истории дайджестов", str(e))
+
+        # Короткая страница не значит конец: PostgREST обрезает ответ до
+        # db-max-rows (1000 в Supabase), даже если limit больше
+        if not response.data:
+            return
+        for row in response.data:
+            yield row
+        last = response.data[-1]
+        cursor = (last["digest_date"], last["project_id"])
+
+
+class ProjectIndex:
+    """
+    Индекс уникальных проектов из digest_reports.
+    После первой полной загрузки дочитываются только строки начиная
+    с последней известной даты, так что стоимость обновления не зависит
+    от накопленной истории.
+
+    Попутно индекс хранит календарь наличия дайджестов: для каждого проекта
+    целое число-битсет, где бит i означает дайджест за день base + i
+    (base - порядковый номер первого известного дня проекта).
+    """
+
+    def __init__(self):
+        self._projects: Dict[int, ProjectInfo] = {}
+        self._snapshot: List[ProjectInfo] = []
+        self._sorted: Dict[str, Tuple[List[tuple], List[ProjectInfo]]] = {}
+        self._watermark: Optional[date] = None
+        self._lock = asyncio.Lock()
+        self.refreshed_at: Optional[float] = None
+        # Хэш содержимого и время последнего изменения - валидаторы для клиентов
+        self.etag: Optional[str] = None
+        self.modified_at: Optional[float] = None
+        self._availability: Dict[int, Tuple[int, int]] = {}
+        self._published_at = 0.0
+        self._flights = SingleFlight()
+
+    @property
+    def loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    def age(self) -> float:
+        if self.refreshed_at is None:
+            return float("inf")
+        return time.monotonic() - self.refreshed_at
+
+    def projects(self) -> List[ProjectInfo]:
+        return self._snapshot
+
+    def available_dates(
+        self, project_id: int, date_from: date, date_to: date
+    ) -> List[date]:
+        """Даты с дайджестом проекта в диапазоне, без обращения к базе"""
+        base, bits = self._availability.get(project_id, (0, 0))
+        start = date_from.toordinal() - base
+        end = date_to.toordinal() - base
+        if end < 0 or bits == 0:
+            return []
+        if start > 0:
+            bits >>= start
+        else:
+            start = 0
+        bits &= (1 << (end - start + 1)) - 1
+        dates = []
+        while bits:
+            lowest = bits & -bits
+            dates.append(date.fromordinal(base + start + lowest.bit_length() - 1))
+            bits ^= lowest
+        return dates
+
+    def _mark_available(self, project_id: int, digest_date: date) -> None:
+        day = digest_date.toordinal()
+        base, bits = self._availability.get(project_id, (day, 0))
+        if day < base:
+            # Строка раньше первого известного дня - сдвигаем начало битсета
+            bits <<= base - day
+            base = day
+        self._availability[project_id] = (base, bits | 1 << (day - base))
+
+    def sorted_by(self, field: str) -> Tuple[List[tuple], List[ProjectInfo]]:
+        """Отсортированные ключи и проекты, пересчитываются при изменении индекса"""
+        cached = self._sorted.get(field)
+        if cached is None:
+            projects = sorted(
+                self._snapshot, key=lambda p: project_sort_key(p, field)
+            )
+            cached = ([project_sort_key(p, field) for p in projects], projects)
+            self._sorted[field] = cached
+        return cached
+
+    async def refresh(self, supabase: AsyncSupabase) -> None:
+        started = time.monotonic()
+        async with self._lock:
+            # Пока ждали блокировку, индекс обновил другой запрос
+            if self.refreshed_at is not None and self.refreshed_at >= started:
+                return
+
+            snapshot = index_store.get("snapshot")
+            fresh_for = min(
+                settings.project_index_refresh_interval,
+                settings.project_index_max_age,
+            )
+            if (
+                snapshot is not None
+                and time.time() - snapshot["published_at"] < fresh_for
+            ):
+                self._adopt(snapshot)
+                return
+
+            leased = index_store.add("lease", os.getpid(), ttl=INDEX_LEASE_TTL)
+            if not leased:
+                # Индекс сейчас обновляет другой воркер
+                if snapshot is None:
+                    snapshot = await self._wait_for_snapshot()
+                if snapshot is not None:
+                    self._adopt(snapshot)
+                if self.loaded:
+                    return
+            try:
+                await self._load(supabase)
+            finally:
+                if leased:
+                    index_store.invalidate("lease")
+
+    async def _load(self, supabase: AsyncSupabase) -> None:
+        changed = False
+        watermark = self._watermark
+        async for row in iter_digest_rows(
+            supabase, PROJECT_COLUMNS, since=self._watermark
+        ):
+            project = ProjectInfo(**{key: row[key] for key in PROJECT_COLUMNS})
+            if self._projects.get(project.project_id) != project:
+                # Более поздние строки содержат актуальные данные проекта
+                self._projects[project.project_id] = project
+                changed = True
+            watermark = date.fromisoformat(row["digest_date"])
+            self._mark_available(project.project_id, watermark)
+
+        if changed:
+            self._snapshot = sorted(
+                self._projects.values(), key=lambda p: p.project_id
+            )
+            self._sorted = {}
+            self.etag = hashlib.sha256(
+                "".join(p.model_dump_json() for p in self._snapshot).encode()
+            ).hexdigest()
+            self.modified_at = time.time()
+        self._watermark = watermark
+        self.refreshed_at = time.monotonic()
+        self._published_at = time.time()
+        index_store.set(
+            "snapshot",
+            {
+                "projects": self._snapshot,
+                "availability": dict(self._availability),
+                "watermark": self._watermark,
+                "etag": self.etag,
+                "modified_at": self.modified_at,
+                "published_at": self._published_at,
+            },
+        )
+
+    @staticmethod
+    async def _wait_for_snapshot() -> Optional[dict]:
+        """При холодном старте ждем снимок от воркера, который держит аренду"""
+        deadline = time.monotonic() + INDEX_LEASE_TTL
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+            snapshot = index_store.get("snapshot")
+            if snapshot is not None:
+                return snapshot
+            if index_store.add("lease", os.getpid(), ttl=INDEX_LEASE_TTL):
+                # Аренда освободилась без снимка - загрузка у другого воркера упала
+                index_store.invalidate("lease")
+                return None
+        return None
+
+    def _adopt(self, snapshot: dict) -> None:
+        """Принимаем снимок, опубликованный другим воркером, если он новее своего"""
+        if snapshot["published_at"] <= self._published_at:
+            return
+        if snapshot["etag"] != self.etag:
+            self._snapshot = list(snapshot["projects"])
+            self._projects = {p.project_id: p for p in self._snapshot}
+            self._sorted = {}
+            self.etag = snapshot["etag"]
+            self.modified_at = snapshot["modified_at"]
+        self._availability = dict(snapshot.get("availability", {}))
+        self._watermark = snapshot["watermark"]
+        self._published_at = snapshot["published_at"]
+        self.refreshed_at = time.monotonic() - (time.time() - self._published_at)
+
+    def stale_for(self) -> float:
+        """Сколько секунд индекс старше PROJECT_INDEX_MAX_AGE (0 - свежий)"""
+        return max(0.0, self.age() - settings.project_index_max_age)
+
+    async def ensure_fresh(self, supabase: AsyncSupabase) -> None:
+        """
+        Если фоновое обновление отстало, устаревший индекс отдается сразу
+        и обновляется одной фоновой задачей. Синхронно ждем базу, только
+        когда индекса нет или он старше допустимого устаревания.
+        """
+        stale_for = self.stale_for()
+        if stale_for == 0:
+            return
+        if self.loaded and stale_for <= settings.stale_max_age:
+            self._flights.spawn("refresh", self._revalidate, supabase)
+            return
+        await self.refresh(supabase)
+
+    async def _revalidate(self, supabase: AsyncSupabase) -> None:
+        try:
+            await self.refresh(supabase)
+        except Exception as e:
+            logger.warning(f"Project index revalidation failed: {str(e)}")
+
+    async def run(self, supabase: AsyncSupabase) -> None:
+        """
+        Перечитывает индекс проектов раз в PROJECT_INDEX_REFRESH_INTERVAL,
+        отсчитывая интервал от возраста уже загруженного индекса.
+        """
+        while True:
+            # Индекс мог быть прогрет при старте или взят у другого воркера
+            delay = settings.project_index_refresh_interval - self.age()
+            if delay <= 0:
+                try:
+                    await self.refresh(supabase)
+                except Exception as e:
+                    logger.error(f"Project index refresh failed: {str(e)}")
+                delay = settings.project_index_refresh_interval
+            await asyncio.sleep(delay)
+
+
+project_index = ProjectIndex()
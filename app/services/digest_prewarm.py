@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from app.cache import create_cache
+from app.config import get_settings
+from app.database import AsyncSupabase
+from app.services.digest import DigestServices
+from app.services.digest_index import iter_digest_rows, project_index
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Отметки о прогретых днях: при нескольких воркерах день прогревает один из них
+prewarm_store = create_cache("digest_prewarm", maxsize=8, ttl=2 * 86400)
+
+
+def prewarm_time() -> Optional[time]:
+    """Время ежедневного прогрева из DIGEST_PREWARM_TIME ("HH:MM"), пусто - выключен"""
+    if not settings.digest_prewarm_time:
+        return None
+    return time.fromisoformat(settings.digest_prewarm_time)
+
+
+class DigestPrewarmer:
+    """
+    Прогрев кэша дайджестами за новый день. Маршрут дайджеста по умолчанию
+    отдает вчерашний день, поэтому после генерации дайджестов все первые
+    запросы утра промахиваются по одному и тому же набору ключей.
+    """
+
+    async def prewarm_day(self, supabase: AsyncSupabase, day: date) -> int:
+        """
+        Одним постраничным запросом загружает дайджесты всех проектов за день.
+        Для проектов без дайджеста кэшируется отсутствие. Возвращает число
+        найденных дайджестов.
+        """
+        await project_index.ensure_fresh(supabase)
+        texts = {}
+        async for row in iter_digest_rows(
+            supabase,
+            ("digest_text",),
+            since=day,
+            until=day,
+            page_size=settings.digest_export_page_size,
+        ):
+            texts[row["project_id"]] = row["digest_text"]
+
+        project_ids = {project.project_id for project in project_index.projects()}
+        for project_id in project_ids | set(texts):
+            DigestServices._remember(project_id, day, texts.get(project_id))
+        return len(texts)
+
+    async def prewarm(self, supabase: AsyncSupabase, day: date) -> None:
+        """
+        Прогревает день, если его еще никто не прогрел. Пока дайджесты за день
+        не появились, повторяет попытку через DIGEST_PREWARM_RETRY_INTERVAL.
+        """
+        key = day.isoformat()
+        for attempt in range(settings.digest_prewarm_attempts):
+            if not prewarm_store.add(key, os.getpid()):
+                return
+            try:
+                found = await self.prewarm_day(supabase, day)
+            except Exception as e:
+                logger.error(f"Digest prewarm for {key} failed: {str(e)}")
+                found = 0
+            if found:
+                logger.info(f"Prewarmed {found} digests for {key}")
+                return
+            # Генерация еще не закончилась - попробуем позже, возможно другим воркером
+            prewarm_store.invalidate(key)
+            await asyncio.sleep(settings.digest_prewarm_retry_interval)
+        logger.warning(f"No digests found for {key} after prewarm attempts")
+
+    async def run(self, supabase: AsyncSupabase) -> None:
+        """
+        Раз в сутки в DIGEST_PREWARM_TIME прогревает кэш дайджестами
+        за вчера; без DIGEST_PREWARM_TIME сразу завершается.
+        """
+        at = prewarm_time()
+        if at is None:
+            return
+        while True:
+            now = datetime.now()
+            target = datetime.combine(now.date(), at)
+            if now >= target:
+                # В том числе при старте в течение дня: день прогревается один раз
+                await self.prewarm(supabase, now.date() - timedelta(days=1))
+                target += timedelta(days=1)
+            await asyncio.sleep(max(1.0, (target - datetime.now()).total_seconds()))
+
+
+digest_prewarmer = DigestPrewarmer()
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import httpx
+from app.cache import create_cache
+from app.config import get_settings
+from app.database import get_http_client
+from app.metrics import Gauge, percentile
+from app.upstream import circuit_states
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+UPSTREAM_UP = Gauge(
+    "upstream_up",
+    "Last health probe of the upstream succeeded (1) or failed (0)",
+    ("upstream",),
+)
+
+# Отчет и аренда на очередной раунд проб. При нескольких воркерах пробы
+# делает один из них, остальные отдают его отчет
+health_store = create_cache("health", maxsize=4, ttl=86400)
+
+# Подряд неудачных проб, после которых upstream считается недоступным
+DOWN_AFTER_FAILURES = 3
+
+# (время, латентность в секундах, успех, текст ошибки)
+Sample = Tuple[float, float, bool, Optional[str]]
+
+
+class HealthMonitor:
+    """
+    Фоновые пробы PostgREST и GoTrue. Эндпоинт здоровья отдает последний
+    готовый отчет и сам в Supabase не ходит, так что частые проверки
+    балансировщика не создают нагрузки на upstream.
+    """
+
+    def __init__(self):
+        self.report: Optional[dict] = None
+
+    @staticmethod
+    def _probes() -> Dict[str, Tuple[str, Dict[str, str]]]:
+        headers = {"apiKey": settings.supabase_key}
+        return {
+            "postgrest": (f"{settings.supabase_url}/rest/v1/", headers),
+            "gotrue": (f"{settings.supabase_url}/auth/v1/health", headers),
+        }
+
+    @staticmethod
+    async def _probe(url: str, headers: Dict[str, str]) -> Sample:
+        started = time.perf_counter()
+        try:
+            response = await get_http_client().get(
+                url, headers=headers, timeout=settings.health_probe_timeout
+            )
+            error = None
+            if response.status_code >= 500:
+                error = f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            error = repr(e)
+        return (time.time(), time.perf_counter() - started, error is None, error)
+
+    async def probe(self) -> dict:
+        """Один раунд проб; результаты добавляются к скользящему окну"""
+        previous = health_store.get("report") or {"upstreams": {}}
+        probes = self._probes()
+        samples = await asyncio.gather(
+            *(self._probe(url, headers) for url, headers in probes.values())
+        )
+        upstreams = {}
+        for name, sample in zip(probes, samples):
+            window = previous["upstreams"].get(name, {}).get("samples", [])
+            window = (window + [sample])[-settings.health_probe_window :]
+            upstreams[name] = self._summarize(window)
+            UPSTREAM_UP.set(name, value=1 if sample[2] else 0)
+
+        states = {upstream["status"] for upstream in upstreams.values()}
+        if "down" in states:
+            status = "unhealthy"
+        elif "degraded" in states:
+            status = "degraded"
+        else:
+            status = "healthy"
+        report = {
+            "status": status,
+            "checked_at": time.time(),
+            "upstreams": upstreams,
+        }
+        health_store.set("report", report)
+        return report
+
+    @staticmethod
+    def _summarize(window: List[Sample]) -> dict:
+        latencies = sorted(sample[1] for sample in window)
+        failures = [sample for sample in window if not sample[2]]
+        consecutive = 0
+        for sample in reversed(window):
+            if sample[2]:
+                break
+            consecutive += 1
+        p95 = percentile(latencies, 0.95)
+
+        if consecutive >= DOWN_AFTER_FAILURES:
+            status = "down"
+        elif failures or p95 > settings.health_latency_threshold:
+            status = "degraded"
+        else:
+            status = "ok"
+        return {
+            "status": status,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.50) * 1000, 1),
+                "p95": round(p95 * 1000, 1),
+                "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            },
+            "error_rate": round(len(failures) / len(window), 3),
+            "consecutive_failures": consecutive,
+            "last_error": failures[-1][3] if failures else None,
+            "samples": window,
+        }
+
+    def current(self) -> Optional[dict]:
+        """Последний отчет (свой или другого воркера) без окна сырых замеров"""
+        report = health_store.get("report") or self.report
+        if report is None:
+            return None
+        return {
+            **report,
+            "age_seconds": round(time.time() - report["checked_at"], 1),
+            # Предохранители вызовов этого воркера
+            "circuits": circuit_states(),
+            "upstreams": {
+                name: {k: v for k, v in upstream.items() if k != "samples"}
+                for name, upstream in report["upstreams"].items()
+            },
+        }
+
+    async def run(self) -> None:
+        """
+        Раунд проб раз в HEALTH_PROBE_INTERVAL; на машине его проводит
+        тот воркер, который первым взял аренду в health_store.
+        """
+        while True:
+            # Не чаще одного раунда за интервал на всю машину
+            if health_store.add(
+                "lease", os.getpid(), ttl=settings.health_probe_interval
+            ):
+                try:
+                    self.report = await self.probe()
+                except Exception as e:
+                    logger.error(f"Health probe failed: {str(e)}")
+            await asyncio.sleep(settings.health_probe_interval)
+
+
+health_monitor = HealthMonitor()
@@ -0,0 +1,10 @@
+import markdown
+import nh3
+
+MARKDOWN_EXTENSIONS = ["tables", "fenced_code", "sane_lists"]
+
+
+def render_markdown(text: str) -> str:
+    """Markdown -> HTML с очисткой от скриптов и опасных атрибутов"""
+    html = markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS)
+    return nh3.clean(html)
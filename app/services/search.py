@@ -0,0 +1,408 @@
+import asyncio
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.database import AsyncSupabase
+from app.services.digest_index import iter_digest_rows
+
+try:
+    import snowballstemmer
+except ImportError:  # без snowballstemmer ищем по словоформам без стемминга
+    snowballstemmer = None
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_WORD = re.compile(r"\w+")
+_CYRILLIC = re.compile(r"[а-я]")
+
+STOP_WORDS = frozenset(
+    """
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за
+    бы по только ее мне было вот от меня еще нет о из ему теперь когда даже ну
+    ли если уже или ни быть был него до вас нибудь опять уж вам ведь там потом
+    себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам
+    чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому
+    этого какой совсем ним здесь этом один почти мой тем чтобы нее были куда
+    зачем всех никогда можно при наконец два об другой хоть после над больше
+    тот через эти нас про всего них какая много разве три эту моя впрочем
+    хорошо свою этой перед иногда лучше чуть том нельзя такой им более всегда
+    конечно всю между the a an and or of to in on for is are was be by with
+    """.split()
+)
+
+# BM25
+K1 = 1.2
+B = 0.75
+
+# Вокруг найденных слов в сниппет попадает столько слов
+SNIPPET_WORDS = 30
+
+# Сколько документов страницы добавляется в индекс без возврата в event loop
+ADD_BATCH = 20
+
+# Сколько основ запроса участвуют в ранжировании: каждая - проход по
+# ее списку вхождений, берутся самые редкие (и самые значимые) из них
+MAX_QUERY_TERMS = 8
+
+# Retry-After (секунд) для поиска, пока индекс строится после старта
+SEARCH_WARMUP_RETRY_AFTER = 10
+
+
+class _Stemmer:
+    """
+    Стемминг русских и английских слов с кэшем словоформ.
+    Стеммеры snowballstemmer хранят состояние разбора в самом объекте,
+    а тексты разбираются в пуле потоков - у каждого потока свои стеммеры.
+    Общий кэш - обычный dict: гонка дает лишь повторный стемминг слова.
+    """
+
+    CACHE_SIZE = 200_000
+
+    def __init__(self):
+        self._local = threading.local()
+        self._cache: Dict[str, str] = {}
+
+    def _stemmers(self) -> tuple:
+        stemmers = getattr(self._local, "stemmers", None)
+        if stemmers is None:
+            stemmers = self._local.stemmers = (
+                snowballstemmer.stemmer("russian"),
+                snowballstemmer.stemmer("english"),
+            )
+        return stemmers
+
+    def stem(self, word: str) -> str:
+        stem = self._cache.get(word)
+        if stem is None:
+            if snowballstemmer is None:
+                stem = word
+            else:
+                russian, english = self._stemmers()
+                if _CYRILLIC.search(word):
+                    stem = russian.stemWord(word)
+                else:
+                    stem = english.stemWord(word)
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.clear()
+            self._cache[word] = stem
+        return stem
+
+
+_stemmer = _Stemmer()
+
+
+def normalize(word: str) -> Optional[str]:
+    """Основа слова для индекса или None для стоп-слов и однобуквенных"""
+    word = word.casefold().replace("ё", "е")
+    if len(word) < 2 or word in STOP_WORDS:
+        return None
+    return _stemmer.stem(word)
+
+
+def tokenize(text: str) -> List[str]:
+    return [term for term in map(normalize, _WORD.findall(text)) if term]
+
+
+def count_terms(text: str) -> Counter:
+    """Частоты основ в тексте; каждая словоформа нормализуется один раз"""
+    terms: Counter = Counter()
+    for word, count in Counter(_WORD.findall(text)).items():
+        term = normalize(word)
+        if term:
+            terms[term] += count
+    return terms
+
+
+def make_snippet(text: str, terms: Set[str]) -> str:
+    """
+    Фрагмент текста вокруг самого плотного скопления найденных слов,
+    совпадения выделены как **слово**.
+    """
+    words = list(_WORD.finditer(text))
+    hits = [i for i, match in enumerate(words) if normalize(match.group()) in terms]
+    if not words:
+        return ""
+    if not hits:
+        start = 0
+    else:
+        # Окно с наибольшим числом совпадений, начиная с одного из них
+        best, start = 0, hits[0]
+        right = 0
+        for left, position in enumerate(hits):
+            while right < len(hits) and hits[right] < position + SNIPPET_WORDS:
+                right += 1
+            if right - left > best:
+                best, start = right - left, position
+        start = max(0, start - SNIPPET_WORDS // 4)
+    end = min(len(words), start + SNIPPET_WORDS)
+
+    hit_set = set(hits)
+    parts = []
+    cursor = words[start].start()
+    for i in range(start, end):
+        match = words[i]
+        parts.append(text[cursor : match.start()])
+        parts.append(f"**{match.group()}**" if i in hit_set else match.group())
+        cursor = match.end()
+    snippet = " ".join("".join(parts).split())
+    if start > 0:
+        snippet = "…" + snippet
+    if end < len(words):
+        snippet += "…"
+    return snippet
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс digest_text в памяти процесса.
+
+    Списки вхождений хранятся в компактных массивах (номер документа и
+    частота слова), сами тексты в индексе не хранятся: сниппеты строятся
+    только для страницы результатов по текстам, прочитанным отдельно. Индекс
+    дочитывается по водяному знаку даты, как и индекс проектов; при
+    превышении SEARCH_MAX_DOCUMENTS вытесняются самые старые дайджесты.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._doc_project = array("i")
+        self._doc_date = array("i")
+        self._doc_length = array("I")
+        self._doc_ids: Dict[Tuple[int, int], int] = {}
+        self._deleted: Set[int] = set()
+        self._total_length = 0
+        self._watermark: Optional[date] = None
+        self._lock = asyncio.Lock()
+        self.refreshed_at: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    @property
+    def documents(self) -> int:
+        return len(self._doc_project) - len(self._deleted)
+
+    def _add(self, project_id: int, day: int, terms: Counter) -> None:
+        previous = self._doc_ids.get((project_id, day))
+        if previous is not None:
+            # Дайджест перечитан (например, день водяного знака) - заменяем
+            self._delete(previous)
+        doc_id = len(self._doc_project)
+        self._doc_project.append(project_id)
+        self._doc_date.append(day)
+        length = sum(terms.values())
+        self._doc_length.append(length)
+        self._total_length += length
+        self._doc_ids[(project_id, day)] = doc_id
+        for term, count in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("H"))
+            postings[0].append(doc_id)
+            postings[1].append(min(count, 0xFFFF))
+
+    def _delete(self, doc_id: int) -> None:
+        self._deleted.add(doc_id)
+        self._total_length -= self._doc_length[doc_id]
+        key = (self._doc_project[doc_id], self._doc_date[doc_id])
+        if self._doc_ids.get(key) == doc_id:
+            del self._doc_ids[key]
+
+    async def _enforce_limits(self) -> None:
+        """
+        Вытеснение старых дайджестов и сжатие индекса. Тяжелые проходы по
+        документам и спискам вхождений идут в пуле потоков: индекс меняет
+        только refresh под блокировкой, а поиск лишь читает его, поэтому
+        новые структуры строятся сбоку и подменяются одним присваиванием.
+        """
+        excess = self.documents - settings.search_max_documents
+        if excess > 0:
+            # Вытесняем с запасом, чтобы не вытеснять на каждой странице
+            excess += settings.search_max_documents // 10
+            for doc_id in await run_in_threadpool(self._oldest, excess):
+                self._delete(doc_id)
+        # Удаленные документы лишь пропускаются при поиске; сжимаем, когда
+        # их накопилась четверть
+        if len(self._deleted) > len(self._doc_project) // 4:
+            self._install(await run_in_threadpool(self._compacted))
+
+    def _oldest(self, count: int) -> List[int]:
+        alive = (
+            doc_id
+            for doc_id in range(len(self._doc_project))
+            if doc_id not in self._deleted
+        )
+        return heapq.nsmallest(count, alive, key=self._doc_date.__getitem__)
+
+    def _compacted(self) -> tuple:
+        """Перенумерованные документы без удаленных и перестроенные вхождения"""
+        remap = array("i", [-1]) * len(self._doc_project)
+        doc_project, doc_date, doc_length = array("i"), array("i"), array("I")
+        for doc_id in range(len(self._doc_project)):
+            if doc_id in self._deleted:
+                continue
+            remap[doc_id] = len(doc_project)
+            doc_project.append(self._doc_project[doc_id])
+            doc_date.append(self._doc_date[doc_id])
+            doc_length.append(self._doc_length[doc_id])
+
+        postings = {}
+        for term, (docs, counts) in self._postings.items():
+            new_docs, new_counts = array("I"), array("H")
+            for doc_id, count in zip(docs, counts):
+                if remap[doc_id] >= 0:
+                    new_docs.append(remap[doc_id])
+                    new_counts.append(count)
+            if new_docs:
+                postings[term] = (new_docs, new_counts)
+
+        doc_ids = {
+            (doc_project[doc_id], doc_date[doc_id]): doc_id
+            for doc_id in range(len(doc_project))
+        }
+        return postings, doc_project, doc_date, doc_length, doc_ids
+
+    def _install(self, compacted: tuple) -> None:
+        (
+            self._postings,
+            self._doc_project,
+            self._doc_date,
+            self._doc_length,
+            self._doc_ids,
+        ) = compacted
+        self._deleted = set()
+
+    @staticmethod
+    def _tokenize_page(rows: List[dict]) -> List[Tuple[int, int, Counter]]:
+        return [
+            (
+                row["project_id"],
+                date.fromisoformat(row["digest_date"]).toordinal(),
+                count_terms(row["digest_text"] or ""),
+            )
+            for row in rows
+        ]
+
+    async def refresh(self, supabase: AsyncSupabase) -> None:
+        """Дочитывает дайджесты начиная с последней проиндексированной даты"""
+        async with self._lock:
+            watermark = self._watermark
+            page: List[dict] = []
+            rows = iter_digest_rows(
+                supabase,
+                ("digest_text",),
+                since=self._watermark,
+                page_size=settings.digest_export_page_size,
+            )
+            async for row in rows:
+                page.append(row)
+                if len(page) == settings.digest_export_page_size:
+                    watermark = await self._index_page(page) or watermark
+                    page = []
+            if page:
+                watermark = await self._index_page(page) or watermark
+            self._watermark = watermark
+            self.refreshed_at = time.monotonic()
+
+    async def _index_page(self, rows: List[dict]) -> Optional[date]:
+        # Разбор текста нагружает CPU - не блокируем event loop,
+        # а сам индекс меняем только из event loop
+        documents = await run_in_threadpool(self._tokenize_page, rows)
+        for position, (project_id, day, terms) in enumerate(documents, 1):
+            self._add(project_id, day, terms)
+            if position % ADD_BATCH == 0:
+                # Добавление документа - сотни вставок в списки вхождений;
+                # отдаем управление, чтобы страница не задерживала запросы
+                await asyncio.sleep(0)
+        await self._enforce_limits()
+        return date.fromisoformat(rows[-1]["digest_date"]) if rows else None
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        offset: int = 0,
+        project_ids: Optional[Iterable[int]] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> Tuple[int, List[Tuple[float, int, date]], Set[str]]:
+        """
+        Ранжирование BM25 по словам запроса с фильтрами.
+        Возвращает число найденных документов, страницу
+        (оценка, проект, дата) и основы слов запроса для сниппетов.
+        Вызывается из пула потоков, пока refresh может подменить структуры
+        индекса, поэтому все чтения идут через один их набор.
+        """
+        postings_by_term, deleted = self._postings, self._deleted
+        doc_project, doc_date = self._doc_project, self._doc_date
+        doc_length = self._doc_length
+
+        terms = set(tokenize(query))
+        ranked = sorted(
+            (term for term in terms if term in postings_by_term),
+            key=lambda term: len(postings_by_term[term][0]),
+        )[:MAX_QUERY_TERMS]
+        projects = set(project_ids) if project_ids is not None else None
+        first = date_from.toordinal() if date_from else None
+        last = date_to.toordinal() if date_to else None
+
+        documents = max(1, self.documents)
+        average_length = max(1.0, self._total_length / documents)
+        scores: Dict[int, float] = {}
+        for term in ranked:
+            docs, counts = postings_by_term[term]
+            # Замененные версии дайджестов до сжатия еще лежат в списке
+            found = min(len(docs), documents)
+            idf = math.log(1 + (documents - found + 0.5) / (found + 0.5))
+            for doc_id, count in zip(docs, counts):
+                if doc_id in deleted:
+                    continue
+                if projects is not None and doc_project[doc_id] not in projects:
+                    continue
+                day = doc_date[doc_id]
+                if (first is not None and day < first) or (
+                    last is not None and day > last
+                ):
+                    continue
+                norm = K1 * (1 - B + B * doc_length[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (K1 + 1) / (
+                    count + norm
+                )
+
+        # При равной оценке выше более свежие дайджесты
+        top = heapq.nlargest(
+            offset + limit,
+            scores.items(),
+            key=lambda item: (item[1], doc_date[item[0]]),
+        )[offset:]
+        page = [
+            (score, doc_project[doc_id], date.fromordinal(doc_date[doc_id]))
+            for doc_id, score in top
+        ]
+        return len(scores), page, terms
+
+    async def run(self, supabase: AsyncSupabase) -> None:
+        """
+        Дочитывает новые дайджесты в поисковый индекс; первый проход
+        строит индекс целиком, пока поиск отвечает 503.
+        """
+        while True:
+            try:
+                await self.refresh(supabase)
+            except Exception as e:
+                logger.error(f"Search index refresh failed: {str(e)}")
+            await asyncio.sleep(settings.search_index_refresh_interval)
+
+
+search_index = SearchIndex()
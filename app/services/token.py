@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from functools import lru_cache
+from typing import Dict, Optional
+import httpx
+from jose import jwt
+from jose.exceptions import JWTError
+from app.config import get_settings
+from app.database import get_http_client
+from app.exceptions.upstream import UpstreamUnavailableError
+from app.upstream import upstream_call
+
+logger = logging.getLogger(__name__)
+
+# Не чаще одного внепланового обновления JWKS за этот интервал (секунды),
+# чтобы токены с неизвестным kid не превращались в поток запросов к GoTrue
+JWKS_MISS_REFRESH_INTERVAL = 30
+
+
+class TokenVerificationError(Exception):
+    """Токен не прошел локальную проверку (подпись, срок действия, аудитория)"""
+
+    pass
+
+
+class TokenVerifier:
+    """Локальная проверка access-токенов Supabase без обращения к GoTrue"""
+
+    def __init__(
+        self,
+        supabase_url: str,
+        api_key: str,
+        jwt_secret: Optional[str],
+        refresh_interval: int,
+    ):
+        self._jwks_url = f"{supabase_url}/auth/v1/.well-known/jwks.json"
+        self._api_key = api_key
+        self._jwt_secret = jwt_secret
+        self._refresh_interval = refresh_interval
+        self._keys: Dict[str, dict] = {}
+        self._fetched_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def verify(self, token: str) -> Optional[dict]:
+        """
+        Возвращает claims токена, если его удалось проверить локально.
+        None означает, что ключ подписи неизвестен и нужна удаленная проверка.
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError as e:
+            raise TokenVerificationError(str(e))
+
+        algorithm = header.get("alg")
+        if algorithm == "HS256":
+            key = self._jwt_secret
+        else:
+            key = await self._get_key(header.get("kid"))
+        if not key:
+            return None
+
+        try:
+            return jwt.decode(
+                token, key, algorithms=[algorithm], audience="authenticated"
+            )
+        except JWTError as e:
+            raise TokenVerificationError(str(e))
+
+    async def warm_up(self) -> None:
+        """Загружаем JWKS заранее, если токены подписываются асимметричным ключом"""
+        if not self._jwt_secret:
+            await self._refresh_keys()
+
+    async def _get_key(self, kid: Optional[str]) -> Optional[dict]:
+        if not kid:
+            return None
+        age = time.monotonic() - self._fetched_at
+        if age > self._refresh_interval or (
+            kid not in self._keys and age > JWKS_MISS_REFRESH_INTERVAL
+        ):
+            await self._refresh_keys()
+        return self._keys.get(kid)
+
+    async def _refresh_keys(self) -> None:
+        async with self._lock:
+            # Пока ждали блокировку, ключи мог обновить другой запрос
+            if time.monotonic() - self._fetched_at <= JWKS_MISS_REFRESH_INTERVAL:
+                return
+            try:
+                response = await upstream_call(
+                    "auth.jwks",
+                    get_http_client().get,
+                    self._jwks_url,
+                    headers={"apiKey": self._api_key},
+                    timeout=5,
+                )
+                response.raise_for_status()
+                keys = response.json().get("keys", [])
+                self._keys = {key["kid"]: key for key in keys if "kid" in key}
+            except (httpx.HTTPError, UpstreamUnavailableError, ValueError) as e:
+                # Оставляем прежние ключи, запросы уйдут на удаленную проверку
+                logger.warning(f"Failed to refresh JWKS: {str(e)}")
+            self._fetched_at = time.monotonic()
+
+
+@lru_cache()
+def get_token_verifier() -> TokenVerifier:
+    settings = get_settings()
+    return TokenVerifier(
+        supabase_url=settings.supabase_url,
+        api_key=settings.supabase_key,
+        jwt_secret=settings.supabase_jwt_secret,
+        refresh_interval=settings.jwks_refresh_interval,
+    )
@@ -1,15 +1,64 @@
 import logging
-from supabase import Client
+from typing import Optional, Tuple
+from app.database import AsyncSupabase
 from fastapi import HTTPException, status, Request
+from app.cache import create_cache
+from app.config import get_settings
 from app.schemas.user import UserInformationResponse
+from app.exceptions.upstream import UpstreamUnavailableError
+from app.upstream import upstream_call
+from app.services.token import TokenVerificationError, get_token_verifier
 
 logger = logging.getLogger(__name__)
 
+# Колонки таблицы users, которые заполняет AuthServices.register_user и
+# которые есть в UserInformationResponse. Поля *_id и created_at ответа
+# в таблице не записываются: несуществующая колонка в select ломает весь
+# запрос PostgREST, поэтому список задан явно, а не по полям схемы
+USER_COLUMNS = "id, email, first_name, last_name"
+
+user_cache = create_cache(
+    "users",
+    maxsize=get_settings().user_cache_size,
+    ttl=get_settings().user_cache_ttl,
+)
+
 
 class UserServices:
     @staticmethod
-    def get_current_user_from_header(
-        supabase: Client, request: Request
+    def invalidate_user(user_id: str) -> None:
+        """Сбрасываем закэшированный профиль после изменения данных пользователя"""
+        user_cache.invalidate(user_id)
+
+    @staticmethod
+    async def _authenticate(
+        supabase: AsyncSupabase, access_token: str
+    ) -> Tuple[str, Optional[str]]:
+        """Возвращает (id, email) владельца токена"""
+        if get_settings().jwt_verification == "local":
+            try:
+                claims = await get_token_verifier().verify(access_token)
+            except TokenVerificationError as e:
+                logger.warning(f"Local token verification failed: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
+                )
+            if claims and claims.get("sub"):
+                return claims["sub"], claims.get("email")
+
+        # Ключ подписи неизвестен или проверка выключена - спрашиваем GoTrue
+        user_response = await upstream_call(
+            "auth.get_user", supabase.auth.get_user, jwt=access_token
+        )
+        if not user_response or not user_response.user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
+            )
+        return user_response.user.id, user_response.user.email
+
+    @staticmethod
+    async def get_current_user_from_header(
+        supabase: AsyncSupabase, request: Request
     ) -> UserInformationResponse:
         # Получаем заголовок Authorization
         auth_header = request.headers.get("Authorization")
@@ -24,22 +73,19 @@ class UserServices:
         access_token = auth_header.replace("Bearer ", "")
         
         try:
-            # Вместо установки сессии с None в качестве refresh_token,
-            # используем заголовок Authorization напрямую
-            headers = {"Authorization": f"Bearer {access_token}"}
-            
-            # Получаем текущего пользователя с использованием заголовка
-            user_response = supabase.auth.get_user(jwt=access_token)
-            user_id = user_response.user.id
-            
-            if not user_response:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
-                )
+            user_id, email = await UserServices._authenticate(supabase, access_token)
             
+            cached = user_cache.get(user_id)
+            if cached is not None:
+                return cached
+
             # Получаем дополнительные данные пользователя из таблицы users
-            query = supabase.from_("users").select("*").filter("id", "eq", user_id)
-            response = query.execute()
+            query = (
+                supabase.from_("users")
+                .select(USER_COLUMNS)
+                .filter("id", "eq", user_id)
+            )
+            response = await upstream_call("users.select", query.execute)
             
             if not response.data:
                 raise HTTPException(
@@ -48,11 +94,16 @@ class UserServices:
             
             user_data = response.data[0]
             # Добавляем email из данных аутентификации, если его нет в таблице users
-            if 'email' not in user_data and hasattr(user_response.user, 'email'):
-                user_data['email'] = user_response.user.email
+            if 'email' not in user_data and email:
+                user_data['email'] = email
             
-            return UserInformationResponse(**user_data)
+            user = UserInformationResponse(**user_data)
+            user_cache.set(user_id, user)
+            return user
             
+        except (HTTPException, UpstreamUnavailableError):
+            raise
+
         except Exception as e:
             logger.error(f"Authentication error: {str(e)}")
             raise HTTPException(
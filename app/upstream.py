@@ -0,0 +1,205 @@
+import asyncio
+import random
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+import httpx
+from gotrue.errors import AuthRetryableError
+from postgrest.exceptions import APIError
+from app.config import get_settings
+from app.exceptions.upstream import UpstreamUnavailableError
+from app.metrics import Counter, UPSTREAM_DURATION, collectors
+
+T = TypeVar("T")
+
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total", "Retried upstream calls by operation", ("operation",)
+)
+UPSTREAM_REJECTED = Counter(
+    "upstream_rejected_total",
+    "Upstream calls rejected by an open circuit breaker",
+    ("operation",),
+)
+
+# Чтения, которые безопасно повторять при сбоях сети и таймаутах
+IDEMPOTENT_OPERATIONS = {
+    "digest_reports.get",
+    "digest_reports.latest",
+    "digest_reports.scan",
+    "digest_reports.snippets",
+    "users.select",
+    "auth.get_user",
+    "auth.jwks",
+}
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для одного upstream. После failure_threshold сбоев подряд
+    вызовы отклоняются сразу, не дожидаясь таймаутов. Через reset_timeout
+    пропускается один пробный вызов: успех замыкает цепь, сбой снова ее
+    размыкает.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Вызов отменен без результата: пробный слот снова свободен"""
+        self._trial_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(operation: str) -> CircuitBreaker:
+    # Операции auth.* идут в GoTrue, остальные - в PostgREST
+    name = "gotrue" if operation.startswith("auth.") else "postgrest"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        settings = get_settings()
+        breaker = _breakers[name] = CircuitBreaker(
+            name, settings.circuit_failure_threshold, settings.circuit_reset_timeout
+        )
+    return breaker
+
+
+def circuit_states() -> Dict[str, str]:
+    """Состояние предохранителей этого процесса"""
+    return {name: breaker.state for name, breaker in _breakers.items()}
+
+
+@lru_cache()
+def _operation_timeouts() -> Dict[str, float]:
+    """UPSTREAM_TIMEOUTS вида "digest_reports.scan=20,auth.jwks=5" """
+    timeouts = {}
+    for item in get_settings().upstream_timeouts.split(","):
+        if item.strip():
+            operation, _, seconds = item.partition("=")
+            timeouts[operation.strip()] = float(seconds)
+    return timeouts
+
+
+def operation_timeout(operation: str) -> float:
+    return _operation_timeouts().get(operation, get_settings().upstream_timeout)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Сбой связи или перегрузка upstream, а не ответ на сам запрос"""
+    if isinstance(error, (TimeoutError, httpx.TransportError, AuthRetryableError)):
+        return True
+    # Шлюз перед PostgREST отвечает на перегрузку не-JSON телом с этими кодами
+    return isinstance(error, APIError) and str(error.code) in ("502", "503", "504")
+
+
+async def upstream_call(
+    operation: str, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+) -> T:
+    """
+    Единая точка вызова PostgREST/GoTrue: замеряет время каждого запроса
+    с меткой операции и исходом (ok/error/timeout), ограничивает его
+    таймаутом операции, повторяет идемпотентные чтения при временных
+    сбоях и отклоняет вызовы, пока предохранитель upstream разомкнут.
+    """
+    settings = get_settings()
+    breaker = get_breaker(operation)
+    attempts = 1
+    if operation in IDEMPOTENT_OPERATIONS:
+        attempts += settings.upstream_retries
+
+    for attempt in range(attempts):
+        if not breaker.allow():
+            UPSTREAM_REJECTED.inc(operation)
+            raise UpstreamUnavailableError(
+                operation, "upstream временно отключен", breaker.retry_after()
+            )
+        trial = breaker.state == CircuitBreaker.HALF_OPEN
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with asyncio.timeout(operation_timeout(operation)):
+                result = await fn(*args, **kwargs)
+            outcome = "ok"
+            breaker.record_success()
+            return result
+        except Exception as e:
+            if not is_transient(e):
+                # Upstream ответил (например, 4xx) - он жив
+                breaker.record_success()
+                raise
+            if isinstance(e, TimeoutError):
+                outcome = "timeout"
+            breaker.record_failure()
+            if attempt + 1 == attempts:
+                raise UpstreamUnavailableError(
+                    operation, repr(e), breaker.retry_after()
+                ) from e
+        finally:
+            # Пробный вызов отменен (клиент ушел) - результата для предохранителя нет
+            if trial and outcome == "error" and breaker.state == breaker.HALF_OPEN:
+                breaker.release()
+            UPSTREAM_DURATION.observe(
+                time.perf_counter() - started, operation, outcome
+            )
+        UPSTREAM_RETRIES.inc(operation)
+        # Полный джиттер: параллельные повторы не приходят в upstream волной
+        await asyncio.sleep(
+            random.uniform(0, settings.upstream_retry_backoff * 2**attempt)
+        )
+
+
+_STATE_VALUES = {
+    CircuitBreaker.CLOSED: 0,
+    CircuitBreaker.HALF_OPEN: 1,
+    CircuitBreaker.OPEN: 2,
+}
+
+
+def _collect_breakers() -> List[str]:
+    lines = [
+        "# HELP upstream_circuit_state Circuit breaker state "
+        "(0 closed, 1 half-open, 2 open)",
+        "# TYPE upstream_circuit_state gauge",
+    ]
+    for name, state in circuit_states().items():
+        value = _STATE_VALUES[state]
+        lines.append(f'upstream_circuit_state{{upstream="{name}"}} {value}')
+    return lines
+
+
+collectors.append(_collect_breakers)
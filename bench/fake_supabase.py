@@ -0,0 +1,218 @@
+"""
+In-process stand-in for PostgREST and GoTrue.
+
+FakeSupabaseTransport is an httpx transport, so the app's async clients talk
+to it through the normal request path (query building, JSON decoding, auth
+headers) without a network. Each request sleeps for a configurable latency
+to model the upstream round trip.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+import httpx
+from jose import jwt
+
+JWT_SECRET = "bench-jwt-secret"
+USER_ID = "00000000-0000-4000-8000-000000000001"
+USER_EMAIL = "bench@example.com"
+
+_KEYSET = re.compile(
+    r"\(digest_date\.gt\.([^,]+),"
+    r"and\(digest_date\.eq\.([^,]+),project_id\.gt\.(-?\d+)\)\)"
+)
+
+
+def make_access_token(user_id: str = USER_ID, ttl: int = 3600) -> str:
+    return jwt.encode(
+        {
+            "sub": user_id,
+            "email": USER_EMAIL,
+            "aud": "authenticated",
+            "role": "authenticated",
+            "exp": int(time.time()) + ttl,
+        },
+        JWT_SECRET,
+        algorithm="HS256",
+    )
+
+
+def make_digest_rows(projects: int, days: int, text_size: int) -> List[dict]:
+    paragraph = "Работы по проекту выполнены в срок, замечаний нет. "
+    body = (paragraph * (text_size // len(paragraph) + 1))[:text_size]
+    today = date.today()
+    return [
+        {
+            "project_id": project_id,
+            "project_name": f"Проект {project_id}",
+            "project_manager": f"Менеджер {project_id % 17}",
+            "project_manager_email": f"pm{project_id % 17}@example.com",
+            "digest_date": (today - timedelta(days=day)).isoformat(),
+            "digest_text": f"# Дайджест {project_id}\n\n{body}",
+        }
+        for day in range(days, 0, -1)
+        for project_id in range(1, projects + 1)
+    ]
+
+
+def _filter_rows(rows: List[dict], params: Dict[str, List[str]]) -> List[dict]:
+    result = rows
+    for column, values in params.items():
+        if column in ("select", "order", "limit", "offset", "or"):
+            continue
+        for value in values:
+            op, _, operand = value.partition(".")
+            if op == "in":
+                allowed = set(operand.strip("()").split(","))
+                result = [r for r in result if str(r.get(column)) in allowed]
+                continue
+            if value in ("is.null", "not.is.null"):
+                present = value.startswith("not")
+                result = [r for r in result if (r.get(column) is not None) == present]
+                continue
+            compare = {
+                "eq": lambda a, b: a == b,
+                "gt": lambda a, b: a > b,
+                "gte": lambda a, b: a >= b,
+                "lt": lambda a, b: a < b,
+                "lte": lambda a, b: a <= b,
+            }[op]
+            result = [
+                r
+                for r in result
+                if r.get(column) is not None
+                and compare(_coerce(r[column]), _coerce(operand, r[column]))
+            ]
+    if "or" in params:
+        match = _KEYSET.fullmatch(params["or"][0])
+        if match:
+            after_date, same_date, after_project = match.groups()
+            result = [
+                r
+                for r in result
+                if r["digest_date"] > after_date
+                or (
+                    r["digest_date"] == same_date
+                    and r["project_id"] > int(after_project)
+                )
+            ]
+    return result
+
+
+def _coerce(value, like=None):
+    if isinstance(like if like is not None else value, int):
+        return int(value)
+    return value
+
+
+def _shape(rows: List[dict], params: Dict[str, List[str]]) -> List[dict]:
+    if "order" in params:
+        for part in reversed(params["order"][0].split(",")):
+            column, _, direction = part.partition(".")
+            rows = sorted(
+                rows, key=lambda r: r[column], reverse=direction.startswith("desc")
+            )
+    offset = int(params.get("offset", ["0"])[0])
+    if "limit" in params:
+        rows = rows[offset : offset + int(params["limit"][0])]
+    select = params.get("select", ["*"])[0]
+    if select != "*":
+        columns = [column.strip() for column in select.split(",")]
+        rows = [{c: r[c] for c in columns if c in r} for r in rows]
+    return rows
+
+
+class FakeSupabaseTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self,
+        projects: int = 50,
+        days: int = 90,
+        text_size: int = 4000,
+        latency_ms: float = 20.0,
+        jitter_ms: float = 5.0,
+    ):
+        self.rows = make_digest_rows(projects, days, text_size)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.calls: Counter = Counter()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        path = request.url.path
+        self.calls[f"{request.method} {path}"] += 1
+        params = parse_qs(request.url.query.decode())
+
+        if path == "/rest/v1/digest_reports":
+            rows = _shape(_filter_rows(self.rows, params), params)
+            return self._json(200, rows)
+        if path == "/rest/v1/users":
+            if request.method == "POST":
+                return self._json(201, [])
+            return self._json(200, [self._profile()])
+        if path == "/rest/v1/":
+            return self._json(200, {})
+        if path == "/auth/v1/token":
+            return self._json(200, self._session())
+        if path == "/auth/v1/user":
+            if request.method == "PUT":
+                return self._json(200, self._user())
+            token = request.headers.get("authorization", "")[len("Bearer ") :]
+            try:
+                jwt.decode(token, JWT_SECRET, audience="authenticated")
+            except Exception:
+                return self._json(401, {"msg": "invalid JWT", "code": 401})
+            return self._json(200, self._user())
+        if path == "/auth/v1/signup":
+            return self._json(200, self._user())
+        if path in ("/auth/v1/recover", "/auth/v1/health"):
+            return self._json(200, {})
+        if path == "/auth/v1/.well-known/jwks.json":
+            return self._json(200, {"keys": []})
+        return self._json(404, {"message": f"not found: {path}"})
+
+    @staticmethod
+    def _json(status_code: int, payload) -> httpx.Response:
+        return httpx.Response(
+            status_code,
+            content=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+
+    @staticmethod
+    def _user() -> dict:
+        return {
+            "id": USER_ID,
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": USER_EMAIL,
+            "app_metadata": {},
+            "user_metadata": {"first_name": "Bench"},
+            "created_at": "2024-01-01T00:00:00Z",
+        }
+
+    @staticmethod
+    def _profile() -> dict:
+        return {
+            "id": USER_ID,
+            "email": USER_EMAIL,
+            "first_name": "Bench",
+            "last_name": "User",
+            "created_at": "2024-01-01T00:00:00Z",
+        }
+
+    def _session(self, user_id: Optional[str] = None) -> dict:
+        return {
+            "access_token": make_access_token(user_id or USER_ID),
+            "refresh_token": uuid.uuid4().hex,
+            "token_type": "bearer",
+            "expires_in": 3600,
+            "expires_at": int(time.time()) + 3600,
+            "user": self._user(),
+        }
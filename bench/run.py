@@ -0,0 +1,160 @@
+"""
+Throughput benchmark for the API against an in-process fake Supabase.
+
+    python -m bench.run --concurrency 50 --requests 2000 --latency-ms 20
+
+Each scenario drives one endpoint at a fixed concurrency through the ASGI
+app and prints requests per second, latency percentiles and the number of
+upstream calls the fake received, so cache and pooling regressions show up
+in the numbers.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Tuple
+
+from bench.fake_supabase import JWT_SECRET, FakeSupabaseTransport, make_access_token
+
+# Настройки читаются при импорте app.config, поэтому окружение задаем заранее
+os.environ.setdefault("SUPABASE_URL", "http://supabase.bench")
+os.environ.setdefault("SUPABASE_KEY", "bench-anon-key")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench-service-key")
+os.environ.setdefault("SUPABASE_JWT_SECRET", JWT_SECRET)
+# Все запросы сценария login идут с одного адреса и одного email
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx  # noqa: E402
+from app import database  # noqa: E402
+from app.main import app  # noqa: E402
+from app.metrics import percentile  # noqa: E402
+
+Request = Tuple[str, str, dict]
+
+
+def scenarios(projects: int) -> Dict[str, Callable[[], Request]]:
+    token = make_access_token()
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    return {
+        "login": lambda: (
+            "POST",
+            "/auth/login",
+            {"json": {"email": "bench@example.com", "password": "bench123"}},
+        ),
+        "users_me": lambda: (
+            "GET",
+            "/users/me",
+            {"headers": {"Authorization": f"Bearer {token}"}},
+        ),
+        "projects": lambda: ("GET", "/api/digest/projects", {}),
+        "markdown": lambda: (
+            "GET",
+            f"/api/digest/markdown/{random.randint(1, projects)}",
+            {"params": {"digest_date": yesterday}},
+        ),
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    make_request: Callable[[], Request],
+    total: int,
+    concurrency: int,
+) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker() -> None:
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = make_request()
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p90": percentile(latencies, 0.90) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "mean": statistics.fmean(latencies) * 1000,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    fake = FakeSupabaseTransport(
+        projects=args.projects,
+        days=args.days,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+    )
+    database.override_http_transport(fake)
+    # Журнал каждого запроса искажает замеры
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    print(
+        f"concurrency={args.concurrency} requests={args.requests} "
+        f"upstream latency={args.latency_ms}ms projects={args.projects} "
+        f"days={args.days}"
+    )
+    print(
+        f"{'scenario':<10} {'rps':>9} {'p50 ms':>8} {'p90 ms':>8} "
+        f"{'p99 ms':>8} {'errors':>7} {'upstream':>9}"
+    )
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            selected = args.scenario or list(scenarios(args.projects))
+            for name in selected:
+                make_request = scenarios(args.projects)[name]
+                calls_before = sum(fake.calls.values())
+                result = await run_scenario(
+                    client, make_request, args.requests, args.concurrency
+                )
+                upstream = sum(fake.calls.values()) - calls_before
+                print(
+                    f"{name:<10} {result['rps']:>9.1f} {result['p50']:>8.1f} "
+                    f"{result['p90']:>8.1f} {result['p99']:>8.1f} "
+                    f"{result['errors']:>7} {upstream:>9}"
+                )
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=["login", "users_me", "projects", "markdown"],
+        help="run only the given scenario (repeatable)",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args(sys.argv[1:])))
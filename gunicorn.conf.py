@@ -0,0 +1,31 @@
+"""
+Многопроцессный запуск: gunicorn -c gunicorn.conf.py app.main:app
+
+Приложение импортируется в мастере (preload) и наследуется воркерами
+при fork. Кэши, индекс проектов и лимиты запросов общие для воркеров
+(CACHE_BACKEND=shared), поэтому данные Supabase читаются один раз на машину.
+"""
+
+import multiprocessing
+import os
+
+os.environ.setdefault("CACHE_BACKEND", "shared")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "20"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+accesslog = "-"
+
+
+def on_starting(server):
+    # Записи от предыдущего запуска могли быть сериализованы другой версией кода
+    from app.cache import get_shared_store
+
+    store = get_shared_store()
+    store.reset()
+    # Небезопасный каталог хранилища обнаруживается при запуске, а не на запросе
+    store.prepare()